@@ -0,0 +1,6 @@
+"""
+Helpers shared by the advanced SQL notebooks.
+
+The notebooks add their own directory to sys.path (marimo does this), so the modules
+in here are imported as `from demo_db import loaders` etc.
+"""
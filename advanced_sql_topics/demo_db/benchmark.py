@@ -0,0 +1,186 @@
+"""
+Benchmark harness to compare the same queries across DuckDB, PostgreSQL and SQLite.
+
+A query set maps a query name to its SQL, written in the canonical (DuckDB) dialect and translated per engine
+by dialects.transpile. Where that is not enough, the SQL can be a dict of engine name -> SQL instead
+(engines without an entry skip that query). Every query runs once cold (on a new connection of its own: a new
+duckdb.connect to the same database file, or a separate engine without a pool, so the shared engines keep their
+warm pools and pool statistics), then a few warm-up runs, then N timed warm runs. Reported per engine and query: cold time,
+p50/p95/max of the warm runs, rows returned and bytes fetched (size of the result as Arrow columns).
+Only the SQLAlchemy engines really start cold. A second duckdb.connect in the same process shares the database
+instance, and so the buffer pool, of the first; another process cannot open the file while the notebook has it
+open. The DuckDB cold time is that of a new connection on a warm buffer pool; cold_run in the results says which.
+"""
+import json
+import math
+import time
+from contextlib import contextmanager
+
+import duckdb
+import pyarrow as pa
+import sqlalchemy as sa
+
+from demo_db import dialects, instrument
+
+# What the cold run measures (see the module doc).
+COLD_RUN = "new connection"
+COLD_RUN_DUCKDB = "new connection (warm buffer pool)"
+
+QUERY_SETS = {
+    "joins": {
+        "cross_join": "SELECT * FROM t1, t2",
+        "inner_join": "SELECT t1.*, t2.bb FROM t1 JOIN t2 ON t1.t2_aa = t2.aa",
+        "left_join": "SELECT * FROM t1 AS lft LEFT JOIN t2 AS rgt ON lft.t2_aa = rgt.aa",
+        "full_outer_join": "SELECT * FROM t1 AS lft FULL OUTER JOIN t2 AS rgt ON lft.t2_aa = rgt.aa",
+    },
+    "sensors": {
+        "avg_per_sensor": """
+            SELECT s.sensor_id, avg(s.value) AS avg_value, count(value) AS n_rows
+            FROM sensors AS s
+            GROUP BY s.sensor_id""",
+        "avg_per_sensor_after_11": """
+            SELECT s.sensor_id, avg(s.value) AS avg_value, count(value) AS n_rows
+            FROM sensors AS s
+            WHERE EXTRACT(HOUR FROM s.timestamp) > 10
+            GROUP BY s.sensor_id""",
+    },
+    "employee": {
+        "boss_self_join": """
+            SELECT emp.*, boss.emp_name AS boss_name
+            FROM employee AS emp
+            LEFT JOIN employee AS boss ON emp.boss_id = boss.emp_id
+            ORDER BY 2""",
+        "recursive_hierarchy": """
+            WITH RECURSIVE hier_emp AS (
+                SELECT *, 1 AS level FROM employee WHERE boss_id IS NULL
+                    UNION ALL
+                SELECT tr.*, he.level + 1
+                FROM employee AS tr
+                JOIN hier_emp AS he ON tr.boss_id = he.emp_id
+            )
+            SELECT * FROM hier_emp""",
+    },
+    "windows": {
+        "moving_average": """
+            SELECT s.sensor_id, s.timestamp, s.value,
+                avg(s.value) OVER (
+                    PARTITION BY s.sensor_id ORDER BY s.timestamp ROWS BETWEEN 3 PRECEDING AND 3 FOLLOWING
+                ) AS mv_avg_val
+            FROM sensors AS s""",
+        "lag_difference": """
+            SELECT s.sensor_id, s.timestamp, s.value,
+                ROUND(s.value - LAG(s.value, 1, s.value) OVER (PARTITION BY s.sensor_id ORDER BY s.timestamp), 3)
+                AS value_difference
+            FROM sensors AS s""",
+    },
+}
+
+
+def query_for(sql, engine_name, engine):
+    """The SQL to run on engine: sql translated to its dialect, or the entry for engine_name when sql is a per-engine dict."""
+    return sql.get(engine_name) if isinstance(sql, dict) else dialects.transpile_for(sql, engine)
+
+
+def _result_bytes(columns):
+    """Size in bytes of the result columns (lists of values) when held as Arrow arrays."""
+    total = 0
+    for col in columns:
+        try:
+            total += pa.array(col).nbytes
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            total += pa.array([None if v is None else str(v) for v in col]).nbytes
+    return total
+
+
+def _run_once(engine, sql):
+    """Execute sql and fetch all rows. Returns (seconds, rows, bytes)."""
+    if dialects.engine_dialect(engine) == "duckdb":
+        # Use a cursor so the shared connection is not disturbed.
+        cur = instrument.cursor(engine)
+        try:
+            with instrument.measure(cur, sql) as measurement:
+                start = time.perf_counter()
+                table = measurement.result = cur.execute(sql).fetch_arrow_table()
+                seconds = time.perf_counter() - start
+        finally:
+            cur.close()
+        return seconds, table.num_rows, table.nbytes
+    with engine.connect() as con, instrument.measure(engine, sql) as measurement:
+        start = time.perf_counter()
+        rows = measurement.result = con.exec_driver_sql(sql).fetchall()
+        seconds = time.perf_counter() - start
+    return seconds, len(rows), _result_bytes(list(zip(*rows)))
+
+
+@contextmanager
+def _cold_engine(engine):
+    """New connection (DuckDB) or unpooled engine (SQLAlchemy) to the database of engine, closed afterwards."""
+    if dialects.engine_dialect(engine) == "duckdb":
+        cur = engine.cursor()
+        try:
+            path = cur.execute(
+                "SELECT path FROM duckdb_databases() WHERE database_name = current_database()"
+            ).fetchone()[0]
+        finally:
+            cur.close()
+        # An in-memory database cannot be opened again; a cursor is the freshest connection there is.
+        cold = duckdb.connect(path) if path else engine.cursor()
+        try:
+            yield cold
+        finally:
+            cold.close()
+        return
+    cold = sa.create_engine(engine.url, poolclass=sa.pool.NullPool)
+    try:
+        yield cold
+    finally:
+        cold.dispose()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile pct (0-100) of values."""
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def run_benchmark(queries, engines, repeat=10, warmup=2):
+    """
+    Run every query in the query set queries on every engine in engines ({engine name: engine}).
+    Per query: 1 cold run, <warmup> untimed runs, then <repeat> timed warm runs.
+    Returns a list of result dicts, one per engine and query, with times in milliseconds.
+    """
+    results = []
+    for query_name, sql in queries.items():
+        for engine_name, engine in engines.items():
+            engine_sql = query_for(sql, engine_name, engine)
+            if engine_sql is None:
+                continue
+            with _cold_engine(engine) as cold_engine:
+                cold, n_rows, n_bytes = _run_once(cold_engine, engine_sql)
+            for _ in range(warmup):
+                _run_once(engine, engine_sql)
+            warm = [_run_once(engine, engine_sql)[0] for _ in range(repeat)]
+            results.append(
+                {
+                    "query": query_name,
+                    "engine": engine_name,
+                    "cold_ms": round(cold * 1000, 3),
+                    "cold_run": COLD_RUN_DUCKDB if dialects.engine_dialect(engine) == "duckdb" else COLD_RUN,
+                    "p50_ms": round(percentile(warm, 50) * 1000, 3),
+                    "p95_ms": round(percentile(warm, 95) * 1000, 3),
+                    "max_ms": round(max(warm) * 1000, 3),
+                    "rows": n_rows,
+                    "bytes": n_bytes,
+                }
+            )
+    return results
+
+
+def to_json(results, path=None):
+    """The results as a JSON string; also written to path when given."""
+    text = json.dumps(results, indent=2)
+    if path is not None:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return text
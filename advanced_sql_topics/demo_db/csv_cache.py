@@ -0,0 +1,115 @@
+"""
+Parquet sidecar cache for the CSV files in tables/.
+
+Parsing a tab separated file means sniffing the dialect and types and converting text, every time.
+The first time a CSV is read, DuckDB writes it to a typed Parquet file in the cache directory; later reads use
+that file for as long as the CSV keeps its size and modification time. The cache is kept under a size limit by
+evicting the least recently used sidecars.
+Several loader threads read CSVs at once. Removing files goes under a lock and tolerates files another thread
+removed first. Eviction could still remove a sidecar another thread has just handed to DuckDB, so loads of many
+tables run inside deferred_eviction(), which evicts once when they are all done.
+"""
+import contextlib
+import glob
+import hashlib
+import os
+import re
+import threading
+
+CACHE_MAX_BYTES = 2 * 1024**3
+DIGEST_CHARS = 16
+
+_lock = threading.Lock()
+_deferred = 0
+
+
+def sidecar_path(csv_path, cache_dir, reader=""):
+    """
+    Path of the sidecar for csv_path in its current state (the name includes its size and mtime), as parsed by
+    the DuckDB table expression reader.
+    """
+    st = os.stat(csv_path)
+    key = f"{os.path.abspath(csv_path)}|{st.st_size}|{st.st_mtime_ns}|{reader}"
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:DIGEST_CHARS]
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    return f"{cache_dir}/{stem}-{digest}.parquet"
+
+
+def _sidecars_of(csv_path, cache_dir):
+    """Paths of all sidecars of csv_path in cache_dir: exactly <stem>-<digest>.parquet, not those of <stem>-x.csv."""
+    stem = os.path.splitext(os.path.basename(csv_path))[0]
+    name = re.compile(rf"{re.escape(stem)}-[0-9a-f]{{{DIGEST_CHARS}}}\.parquet")
+    return [os.path.join(cache_dir, entry) for entry in os.listdir(cache_dir) if name.fullmatch(entry)]
+
+
+def evict(cache_dir, max_bytes=CACHE_MAX_BYTES, keep=None, pattern="*.parquet"):
+    """
+    Remove least recently used files matching pattern from cache_dir until the rest takes at most max_bytes.
+    A file counts as used when it was written or read (its mtime). The file keep is never removed.
+    Returns the paths that were removed.
+    """
+    with _lock:
+        entries = []
+        for path in glob.glob(f"{cache_dir}/{pattern}"):
+            with contextlib.suppress(FileNotFoundError):
+                st = os.stat(path)
+                entries.append((st.st_mtime_ns, st.st_size, path))
+        total = sum(size for _mtime, size, _path in entries)
+        removed = []
+        for _mtime, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+                removed.append(path)
+            total -= size
+    return removed
+
+
+@contextlib.contextmanager
+def deferred_eviction(cache_dir, max_bytes=CACHE_MAX_BYTES):
+    """
+    Within the block csv_source() does not evict, so no sidecar it returned is removed before it is read;
+    cache_dir is evicted down to max_bytes once at the end (not at all when cache_dir is None).
+    """
+    global _deferred
+    with _lock:
+        _deferred += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _deferred -= 1
+        if cache_dir is not None and os.path.isdir(cache_dir):
+            evict(cache_dir, max_bytes)
+
+
+def csv_source(csv_path, ddb_eng, cache_dir, max_bytes=CACHE_MAX_BYTES, reader=None):
+    """
+    DuckDB table expression to read csv_path: `read_parquet(...)` of its sidecar, which is written first if the
+    CSV is new or changed. Sidecars of older versions of the same CSV are removed, then the cache is evicted
+    down to max_bytes (unless inside deferred_eviction()). reader is the table expression that parses the CSV
+    (default: read_csv_auto).
+    """
+    reader = reader or f"read_csv_auto('{csv_path}')"
+    os.makedirs(cache_dir, exist_ok=True)
+    path = sidecar_path(csv_path, cache_dir, reader)
+    with _lock:
+        if os.path.exists(path):
+            os.utime(path)  # Mark as recently used for the eviction.
+            return f"read_parquet('{path}')"
+        for old_path in _sidecars_of(csv_path, cache_dir):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(old_path)
+    tmp_path = f"{path}.tmp"
+    cur = ddb_eng.cursor()
+    try:
+        cur.execute(f"COPY (SELECT * FROM {reader}) TO '{tmp_path}' (FORMAT parquet)")
+    finally:
+        cur.close()
+    os.replace(tmp_path, path)
+    if not _deferred:
+        evict(cache_dir, max_bytes, keep=path)
+    return f"read_parquet('{path}')"
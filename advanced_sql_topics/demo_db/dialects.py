@@ -0,0 +1,115 @@
+"""
+One canonical SQL text for all three engines, translated per engine with sqlglot.
+
+The canonical dialect is DuckDB's. sqlglot handles most differences, but not the two this notebook keeps running
+into, so those are rewritten here:
+  - EXTRACT(<part> FROM ts) does not exist in SQLite; it becomes CAST(strftime('%H', ts) AS INTEGER) and friends.
+  - ROUND(x, n) on a double is an error in Postgres; x is cast to NUMERIC first.
+Parsing and generating SQL takes time, so translations are cached by (sql hash, source dialect, target dialect).
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import sqlglot
+from sqlglot import exp
+
+CANONICAL_DIALECT = "duckdb"
+CACHE_SIZE = 1024
+
+_SQLITE_DATE_PARTS = {
+    "YEAR": "%Y",
+    "MONTH": "%m",
+    "DAY": "%d",
+    "HOUR": "%H",
+    "MINUTE": "%M",
+    "SECOND": "%S",
+}
+
+_cache = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+
+
+def engine_dialect(engine):
+    """sqlglot dialect name for a SQLAlchemy engine or DuckDB connection."""
+    dialect = getattr(engine, "dialect", None)
+    if dialect is None:
+        return "duckdb"
+    return "postgres" if dialect.name == "postgresql" else dialect.name
+
+
+def _rewrite_for(dialect):
+    """Expression transform with the rewrites sqlglot does not do for dialect."""
+
+    def rewrite(node):
+        if dialect == "sqlite" and isinstance(node, exp.Extract):
+            fmt = _SQLITE_DATE_PARTS.get(node.this.name.upper())
+            if fmt is not None:
+                strftime = exp.Anonymous(this="strftime", expressions=[exp.Literal.string(fmt), node.expression])
+                return exp.cast(strftime, "INTEGER")
+        if dialect == "postgres" and isinstance(node, exp.Round) and node.args.get("decimals") is not None:
+            if not (isinstance(node.this, exp.Cast) and node.this.to.is_type("decimal")):
+                return exp.Round(this=exp.cast(node.this, "NUMERIC"), decimals=node.args["decimals"])
+        return node
+
+    return rewrite
+
+
+def _transpile_uncached(sql, dialect, read):
+    statements = []
+    for expression in sqlglot.parse(sql, read=read):
+        if expression is None:
+            continue
+        statements.append(expression.transform(_rewrite_for(dialect)).sql(dialect=dialect, pretty=True))
+    return ";\n".join(statements)
+
+
+def transpile(sql, dialect, read=CANONICAL_DIALECT):
+    """sql (written for read) translated to dialect. Results are cached, see cache_info()."""
+    key = (hashlib.sha1(sql.encode("utf-8")).hexdigest(), read, dialect)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return _cache[key]
+        _cache_stats["misses"] += 1
+    translated = _transpile_uncached(sql, dialect, read)
+    with _cache_lock:
+        _cache[key] = translated
+        if len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+    return translated
+
+
+def transpile_for(sql, engine, read=CANONICAL_DIALECT):
+    """sql translated to the dialect of engine (SQLAlchemy engine or DuckDB connection)."""
+    return transpile(sql, engine_dialect(engine), read)
+
+
+def cache_info():
+    """Dict with the cache hits, misses and current number of entries."""
+    with _cache_lock:
+        return {**_cache_stats, "size": len(_cache)}
+
+
+def clear_cache():
+    """Empty the translation cache and reset its counters."""
+    with _cache_lock:
+        _cache.clear()
+        _cache_stats.update(hits=0, misses=0)
+
+
+def benchmark_cache(sql, dialect, n=200):
+    """Average cost in microseconds of translating sql to dialect without the cache (miss) and from the cache (hit)."""
+    start = time.perf_counter()
+    for _ in range(n):
+        _transpile_uncached(sql, dialect, CANONICAL_DIALECT)
+    miss = (time.perf_counter() - start) / n
+    transpile(sql, dialect)
+    start = time.perf_counter()
+    for _ in range(n):
+        transpile(sql, dialect)
+    hit = (time.perf_counter() - start) / n
+    return {"miss_us": miss * 1e6, "hit_us": hit * 1e6, "speedup": miss / hit}
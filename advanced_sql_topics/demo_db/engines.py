@@ -0,0 +1,173 @@
+"""
+Shared, pooled SQLAlchemy engines for the notebooks.
+
+Creating an engine in a cell means a new pool, and new connections, every time the cell runs. The engines here are
+created once per process and handed out again on the next call with the same URL and pool settings, so under
+`marimo edit` / `marimo run` re-running a cell (or another notebook in the same process) reuses warm connections.
+The pools are instrumented: pool_stats() reports checkout latency, saturation and connection counts.
+
+probe_postgres() checks in the background, with a short timeout, whether the Postgres container is up, so the
+notebook does not hang on a missing server; fallback_engine() is a local stand-in for when it is not.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+import sqlalchemy as sa
+from sqlalchemy.pool import QueuePool
+
+POOL_SIZE = 5
+MAX_OVERFLOW = 10
+POOL_RECYCLE = 1800  # seconds; Postgres in Docker may drop idle connections.
+LATENCY_SAMPLES = 1000
+PROBE_TIMEOUT = 2.0  # seconds
+
+_engines = {}
+_engines_lock = threading.Lock()
+_probe_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pg-probe")
+
+
+class PoolMetrics:
+    """Checkout latencies (the last LATENCY_SAMPLES) and counters of a pool, and the max_overflow it was made with."""
+
+    def __init__(self, max_overflow=MAX_OVERFLOW):
+        self.max_overflow = max_overflow
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.checkouts = 0
+        self.connects = 0
+        self.lock = threading.Lock()
+
+    def record_checkout(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.checkouts += 1
+
+
+class MeteredQueuePool(QueuePool):
+    """QueuePool that times every checkout: waiting for a free connection, or opening a new one, plus pre-ping."""
+
+    metrics = None
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.metrics.record_checkout(time.perf_counter() - start)
+
+    def recreate(self):
+        # engine.dispose() replaces the pool; keep counting in the same metrics.
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+
+def get_engine(url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_pre_ping=True, pool_recycle=POOL_RECYCLE):
+    """The process-wide engine for url with these pool settings; created on the first call."""
+    key = (url, pool_size, max_overflow, pool_pre_ping, pool_recycle)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = sa.create_engine(
+                url,
+                poolclass=MeteredQueuePool,
+                pool_size=pool_size,
+                max_overflow=max_overflow,
+                pool_pre_ping=pool_pre_ping,
+                pool_recycle=pool_recycle,
+            )
+            metrics = PoolMetrics(max_overflow)
+            engine.pool.metrics = metrics
+
+            @sa.event.listens_for(engine, "connect")
+            def count_connect(_dbapi_con, _record):
+                with metrics.lock:
+                    metrics.connects += 1
+
+            _engines[key] = engine
+        return engine
+
+
+def postgres_url(password=None, host="localhost", port=5432):
+    """URL of the demo Postgres; the password defaults to $POSTGRES_PASSWORD (or "pybites")."""
+    if password is None:
+        password = os.environ.get("POSTGRES_PASSWORD", "pybites")
+    return f"postgresql+psycopg2://postgres:{password}@{host}:{port}/postgres"
+
+
+def postgres_engine(**pool_settings):
+    """Shared engine for the demo Postgres in the pbpg container."""
+    return get_engine(postgres_url(), **pool_settings)
+
+
+def sqlite_engine(path="demo.sqlite", **pool_settings):
+    """Shared engine for the SQLite database file at path."""
+    return get_engine(f"sqlite:///{path}", **pool_settings)
+
+
+def fallback_engine(path="demo_pg_fallback.sqlite", **pool_settings):
+    """Local in-process stand-in for Postgres: a shared engine on a separate SQLite file."""
+    return sqlite_engine(path, **pool_settings)
+
+
+def _ping(url, timeout):
+    # A throwaway engine, so a failing probe leaves nothing behind in the shared pools.
+    engine = sa.create_engine(
+        url, poolclass=sa.pool.NullPool, connect_args={"connect_timeout": max(1, math.ceil(timeout))}
+    )
+    try:
+        with engine.connect() as connection:
+            connection.execute(sa.text("SELECT 'pong'"))
+    finally:
+        engine.dispose()
+
+
+def probe_postgres(url=None, timeout=PROBE_TIMEOUT):
+    """
+    Start checking whether Postgres at url (default: postgres_url()) answers, in a background thread.
+    Returns at once with a Future; pass it to postgres_available() when the answer is needed.
+    """
+    return _probe_pool.submit(_ping, url or postgres_url(), timeout)
+
+
+def postgres_available(probe, timeout=PROBE_TIMEOUT):
+    """
+    Wait at most timeout seconds for the probe from probe_postgres().
+    Returns (True, None) when Postgres answered, else (False, the error or a timeout message).
+    """
+    try:
+        probe.result(timeout=timeout)
+    except FutureTimeoutError:
+        return False, f"no answer within {timeout}s"
+    except Exception as e:
+        return False, e
+    return True, None
+
+
+def pool_stats(engine):
+    """Dict with the pool's connection counts, saturation and checkout latency (ms) of an engine from get_engine."""
+    pool = engine.pool
+    metrics = pool.metrics
+    with metrics.lock:
+        latencies = sorted(metrics.latencies)
+        checkouts = metrics.checkouts
+        connects = metrics.connects
+    # A negative max_overflow means no limit.
+    capacity = pool.size() + metrics.max_overflow if metrics.max_overflow >= 0 else None
+    stats = {
+        "engine": engine.url.render_as_string(hide_password=True),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "saturation": round(pool.checkedout() / capacity, 3) if capacity else None,
+        "checkouts": checkouts,
+        "connects": connects,
+    }
+    if latencies:
+        stats["checkout_ms_mean"] = round(sum(latencies) / len(latencies) * 1000, 3)
+        stats["checkout_ms_p95"] = round(latencies[int(0.95 * (len(latencies) - 1))] * 1000, 3)
+        stats["checkout_ms_max"] = round(latencies[-1] * 1000, 3)
+    return stats
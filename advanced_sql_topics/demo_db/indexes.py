@@ -0,0 +1,127 @@
+"""
+Indexes and planner statistics for the demo tables.
+
+A freshly loaded table has no index and no statistics, so every join, filter and window over it is a full scan
+plus sort. INDEX_SPEC declares per table the column lists to index: the join keys (t1.t2_aa = t2.aa,
+employee.boss_id = emp_id) and the PARTITION BY / ORDER BY of the sensor windows. The loads in ingest build these
+after the data is in (indexing an empty table and then inserting is slower) and run ANALYZE afterwards, so the
+planners know the table sizes and value distributions.
+Note that DuckDB only uses its (ART) indexes for point lookups and constraints; its joins are hash joins either way.
+"""
+import sqlalchemy as sa
+
+from demo_db import benchmark
+
+INDEX_SPEC = {
+    "sensors": [("sensor_id", "timestamp")],
+    "employee": [("boss_id",), ("emp_id",)],
+    "t1": [("t2_aa",)],
+    "t2": [("aa",)],
+}
+
+
+def index_name(name, columns):
+    """Name of the index on columns of table <name>, the same as the one loaders.bulk_load_sqlite builds."""
+    return f"ix_{name}_{'_'.join(columns)}"
+
+
+def table_exists(backend, name, engine):
+    """True when table <name> exists in the backend."""
+    if backend == "duckdb":
+        cur = engine.cursor()
+        try:
+            return cur.execute("SELECT count(*) FROM duckdb_tables() WHERE table_name = ?", [name]).fetchone()[0] > 0
+        finally:
+            cur.close()
+    return sa.inspect(engine).has_table(name)
+
+
+def existing_indexes(backend, name, engine):
+    """Set of the names of the indexes on table <name> in the backend."""
+    if backend == "duckdb":
+        cur = engine.cursor()
+        try:
+            rows = cur.execute("SELECT index_name FROM duckdb_indexes() WHERE table_name = ?", [name]).fetchall()
+        finally:
+            cur.close()
+        return {row[0] for row in rows}
+    return {index["name"] for index in sa.inspect(engine).get_indexes(name)}
+
+
+def _execute(backend, engine, statements):
+    """Run statements one after another on the backend, in one transaction for the SQLAlchemy engines."""
+    if backend == "duckdb":
+        cur = engine.cursor()
+        try:
+            for statement in statements:
+                cur.execute(statement)
+        finally:
+            cur.close()
+        return
+    with engine.begin() as con:
+        for statement in statements:
+            con.execute(sa.text(statement))
+
+
+def create_indexes(backend, name, engine, spec=INDEX_SPEC, analyze=True):
+    """
+    Create the indexes that spec lists for table <name> and are missing in the backend, then ANALYZE the table.
+    With analyze (for a table that was just loaded) the table is analyzed also when no index was missing or spec
+    lists none for it; without, only when an index was created. Returns the names of the indexes that were created.
+    """
+    existing = existing_indexes(backend, name, engine)
+    missing = [columns for columns in spec.get(name, ()) if index_name(name, columns) not in existing]
+    statements = [
+        f'CREATE INDEX "{index_name(name, columns)}" ON "{name}" ({", ".join(f"\"{col}\"" for col in columns)})'
+        for columns in missing
+    ]
+    if statements or analyze:
+        _execute(backend, engine, statements + [f'ANALYZE "{name}"'])
+    return [index_name(name, columns) for columns in missing]
+
+
+def drop_indexes(backend, name, engine, spec=INDEX_SPEC):
+    """Drop the indexes that spec lists for table <name> from the backend, where they exist."""
+    existing = existing_indexes(backend, name, engine)
+    statements = [
+        f'DROP INDEX "{index_name(name, columns)}"'
+        for columns in spec.get(name, ())
+        if index_name(name, columns) in existing
+    ]
+    if statements:
+        _execute(backend, engine, statements)
+
+
+def measure_speedup(queries, engines, spec=INDEX_SPEC, repeat=10):
+    """
+    Run the query set queries (see benchmark.QUERY_SETS) on engines ({backend: engine}) once without and once
+    with the indexes of spec (and fresh statistics). Tables of spec that a backend does not have are skipped.
+    The indexes are built again also when the run without them fails. Returns a list of dicts per query and
+    engine with the p50 times in milliseconds and the speedup (time without / time with indexes).
+    """
+    tables = {
+        backend: [name for name in spec if table_exists(backend, name, engine)] for backend, engine in engines.items()
+    }
+    runs = {}
+    try:
+        for backend, engine in engines.items():
+            for name in tables[backend]:
+                drop_indexes(backend, name, engine, spec)
+        runs[False] = benchmark.run_benchmark(queries, engines, repeat=repeat)
+    finally:
+        for backend, engine in engines.items():
+            for name in tables[backend]:
+                create_indexes(backend, name, engine, spec)
+    runs[True] = benchmark.run_benchmark(queries, engines, repeat=repeat)
+    report = []
+    for without, with_ in zip(runs[False], runs[True]):
+        report.append(
+            {
+                "query": without["query"],
+                "engine": without["engine"],
+                "without_ms": without["p50_ms"],
+                "with_ms": with_["p50_ms"],
+                "speedup": round(without["p50_ms"] / max(with_["p50_ms"], 1e-3), 2),
+            }
+        )
+    return report
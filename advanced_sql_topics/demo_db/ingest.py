@@ -0,0 +1,381 @@
+"""
+Orchestration of table loads into the three demo databases.
+
+Each backend has a load_<backend> function that drops and (re)creates one table from the source data:
+a pandas DataFrame, or with transfer="arrow" a pyarrow Table that goes to the databases without pandas.
+They share nothing but the source data, so they can run side by side.
+Tables listed in schemas.SCHEMAS are parsed and created with their declared column types in every database.
+After the data is in, each builds the indexes that indexes.INDEX_SPEC lists for the table and runs ANALYZE.
+DuckDB also rebuilds the minute/hour/day rollups of the tables in rollups.ROLLUP_TABLES.
+With transfer="stream" nothing is materialized: DuckDB loads the CSV itself and the other databases each read
+fixed-size record batches from the DuckDB table, so memory use does not depend on the size of the table.
+"""
+import contextlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pyarrow as pa
+import sqlalchemy as sa
+
+from demo_db import csv_cache, indexes, loaders, manifest as load_manifest, result_cache, rollups, schemas
+
+# SQLite allows a single writer per database file; loads of several tables into the same file take turns.
+_sqlite_write_locks = {}
+_sqlite_write_locks_lock = threading.Lock()
+
+STREAM_BATCH_ROWS = 65_536
+
+
+def csv_source(name, ddb_eng, tables_dir="tables", cache_dir=None):
+    """
+    DuckDB table expression that reads <tables_dir>/<name>.csv, with the column types of its schema (see schemas).
+    With a cache_dir the data comes from a Parquet sidecar in there, see csv_cache.
+    """
+    csv_path = f"{tables_dir}/{name}.csv"
+    reader = schemas.csv_reader(name, csv_path)
+    if cache_dir is None:
+        return reader
+    return csv_cache.csv_source(csv_path, ddb_eng, cache_dir, reader=reader)
+
+
+def read_csv(name, ddb_eng, tables_dir="tables", transfer="pandas", cache_dir=None):
+    """Parse <tables_dir>/<name>.csv with DuckDB and return it as a pandas DataFrame, or a pyarrow Table for transfer="arrow"."""
+    source = csv_source(name, ddb_eng, tables_dir, cache_dir)
+    cur = ddb_eng.cursor()
+    try:
+        result = cur.execute(f"SELECT * FROM {source}")
+        return result.fetch_arrow_table() if transfer == "arrow" else result.fetchdf()
+    finally:
+        cur.close()
+
+
+def stream_table(name, ddb_eng, batch_rows=STREAM_BATCH_ROWS):
+    """
+    pyarrow RecordBatchReader over table <name> in DuckDB, with batches of at most batch_rows rows.
+    The reader has its own DuckDB cursor, which is closed once the reader is exhausted.
+    """
+    cur = ddb_eng.cursor()
+    reader = cur.execute(f"SELECT * FROM {name}").fetch_record_batch(batch_rows)
+
+    def batches():
+        try:
+            yield from reader
+        finally:
+            cur.close()
+
+    return pa.RecordBatchReader.from_batches(reader.schema, batches())
+
+
+def _is_arrow(table_data):
+    return isinstance(table_data, (pa.Table, pa.RecordBatchReader))
+
+
+def _to_pandas(table_data):
+    return table_data.read_all().to_pandas() if isinstance(table_data, pa.RecordBatchReader) else table_data.to_pandas()
+
+
+def _create_duckdb(cur, name, select):
+    """Create table <name> in DuckDB from the query select, as its declared schema when it has one."""
+    ddl = schemas.duckdb_ddl(name)
+    if ddl is None:
+        cur.execute(f"CREATE TABLE {name} AS {select}")
+    else:
+        cur.execute(ddl)
+        cur.execute(f"INSERT INTO {name} BY NAME {select}")
+
+
+def _to_sql(table_data, name, engine):
+    """Plain pandas to_sql of table_data, into the table created with its declared schema when it has one."""
+    if_exists = "append" if schemas.create_table(name, engine) else "fail"
+    table_df = _to_pandas(table_data) if _is_arrow(table_data) else table_data
+    if engine.dialect.name == "sqlite":
+        table_df = loaders.sqlite_frame(table_df)  # The same timestamp text as the bulk loaders.
+    table_df.to_sql(name, engine, index=False, if_exists=if_exists)
+
+
+def _write_lock(engine):
+    """
+    Lock for loads into the database of the SQLAlchemy engine: one per SQLite file, and a no-op for the other
+    dialects. It goes by the dialect, not the backend, as the stand-in for Postgres (engines.fallback_engine) is
+    SQLite too.
+    """
+    if engine.dialect.name != "sqlite":
+        return contextlib.nullcontext()
+    with _sqlite_write_locks_lock:
+        return _sqlite_write_locks.setdefault(engine.url.database, threading.Lock())
+
+
+def load_duckdb_csv(name, ddb_eng, tables_dir="tables", cache_dir=None, index_spec=indexes.INDEX_SPEC):
+    """(Re)create table <name> in DuckDB straight from <tables_dir>/<name>.csv, without passing through Python."""
+    source = csv_source(name, ddb_eng, tables_dir, cache_dir)
+    cur = ddb_eng.cursor()
+    try:
+        cur.execute(f"DROP TABLE IF EXISTS {name};")
+        _create_duckdb(cur, name, f"SELECT * FROM {source}")
+    finally:
+        cur.close()
+    indexes.create_indexes("duckdb", name, ddb_eng, index_spec)
+    if name in rollups.ROLLUP_TABLES:
+        rollups.build_rollups(ddb_eng, name)
+    return "DuckDB ✓"
+
+
+def load_duckdb(name, table_data, ddb_eng, index_spec=indexes.INDEX_SPEC):
+    """
+    (Re)create table <name> in DuckDB from table_data. Uses its own cursor, so it is safe in a worker thread.
+    table_data may also be a callable returning the data, e.g. a generated RecordBatchReader (see synthetic).
+    """
+    cur = ddb_eng.cursor()
+    try:
+        cur.execute(f"DROP TABLE IF EXISTS {name};")
+        if callable(table_data):
+            table_data = table_data()
+        cur.register("_src_data", table_data)
+        _create_duckdb(cur, name, "SELECT * FROM _src_data")
+        cur.unregister("_src_data")
+    finally:
+        cur.close()
+    indexes.create_indexes("duckdb", name, ddb_eng, index_spec)
+    if name in rollups.ROLLUP_TABLES:
+        rollups.build_rollups(ddb_eng, name)
+    return "DuckDB ✓"
+
+
+def load_postgres(name, table_data, pg_eng, mode="copy", index_spec=indexes.INDEX_SPEC):
+    """
+    (Re)create table <name> in Postgres from table_data, with COPY (mode "copy") or plain to_sql.
+    table_data may also be a callable returning the data, e.g. a fresh stream_table reader.
+    """
+    with _write_lock(pg_eng):
+        with pg_eng.connect() as con_out:
+            con_out.execute(sa.text(f"DROP TABLE IF EXISTS {name}"))
+            con_out.commit()
+        if callable(table_data):
+            table_data = table_data()
+        is_arrow = _is_arrow(table_data)
+        if mode == "copy":
+            copy = loaders.copy_arrow_to_postgres if is_arrow else loaders.copy_to_postgres
+            rate = copy(table_data, name, pg_eng)
+            indexes.create_indexes("postgres", name, pg_eng, index_spec)
+            return f"PostgreSQL ✓ ({rate:,.0f} rows/s)"
+        _to_sql(table_data, name, pg_eng)
+        indexes.create_indexes("postgres", name, pg_eng, index_spec)
+        return "PostgreSQL ✓"
+
+
+def load_sqlite(name, table_data, lite_eng, mode="bulk", index_spec=indexes.INDEX_SPEC):
+    """
+    (Re)create table <name> in SQLite from table_data, with the bulk path (mode "bulk") or plain to_sql.
+    table_data may also be a callable returning the data, e.g. a fresh stream_table reader.
+    """
+    with _write_lock(lite_eng):
+        with lite_eng.connect() as con_out:
+            con_out.execute(sa.text(f"DROP TABLE IF EXISTS {name}"))
+            con_out.commit()
+        if callable(table_data):
+            table_data = table_data()
+        is_arrow = _is_arrow(table_data)
+        if mode == "bulk":
+            bulk_load = loaders.bulk_load_sqlite_arrow if is_arrow else loaders.bulk_load_sqlite
+            rate = bulk_load(table_data, name, lite_eng)
+            indexes.create_indexes("sqlite", name, lite_eng, index_spec)
+            return f"SQLite ✓ ({rate:,.0f} rows/s)"
+        _to_sql(table_data, name, lite_eng)
+        indexes.create_indexes("sqlite", name, lite_eng, index_spec)
+        return "SQLite ✓"
+
+
+def _timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    label = func(*args, **kwargs)
+    return label, time.perf_counter() - start
+
+
+def load_backends(
+    name, table_data, ddb_eng, pg_eng, lite_eng, pg_mode="copy", lite_mode="bulk", concurrent=True, prefix=None,
+    backends=None, version=None, index_spec=indexes.INDEX_SPEC,
+):
+    """
+    Load table_data (DataFrame, pyarrow Table, or a callable returning either or a RecordBatchReader) as table <name> into all three databases, or only into the ones listed in backends.
+    With concurrent=True the three loads run at the same time in a thread pool, otherwise one after another.
+    Prints a ✓ per backend as it finishes, followed by the wall times. With a prefix the output is collected
+    and printed as one line starting with prefix, so several tables loading in parallel don't interleave.
+    Every loaded table gets version as its data version in result_cache (default: a fresh unique one).
+    Each backend then builds the indexes index_spec lists for the table and runs ANALYZE (index_spec={}: none).
+    Returns a dict with the wall time in seconds per backend and for the whole call ("total").
+    """
+    version = version or time.time_ns()
+    pieces = []
+
+    def emit(text, end=""):
+        if prefix is None:
+            print(text, end=end)
+        else:
+            pieces.append(text)
+            if end:
+                print(prefix + "".join(pieces))
+
+    engines = {"duckdb": ddb_eng, "postgres": pg_eng, "sqlite": lite_eng}
+    jobs = {
+        "duckdb": (load_duckdb, (name, table_data, ddb_eng), {"index_spec": index_spec}),
+        "postgres": (load_postgres, (name, table_data, pg_eng), {"mode": pg_mode, "index_spec": index_spec}),
+        "sqlite": (load_sqlite, (name, table_data, lite_eng), {"mode": lite_mode, "index_spec": index_spec}),
+    }
+    if backends is not None:
+        jobs = {backend: job for backend, job in jobs.items() if backend in backends}
+    timings = {}
+    start = time.perf_counter()
+    if concurrent:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            futures = {pool.submit(_timed, func, *args, **kwargs): backend for backend, (func, args, kwargs) in jobs.items()}
+            for future in as_completed(futures):
+                label, timings[futures[future]] = future.result()
+                result_cache.set_table_version(engines[futures[future]], name, version)
+                emit(f"{label}. ")
+    else:
+        for backend, (func, args, kwargs) in jobs.items():
+            label, timings[backend] = _timed(func, *args, **kwargs)
+            result_cache.set_table_version(engines[backend], name, version)
+            emit(f"{label}. ")
+    timings["total"] = time.perf_counter() - start
+    per_backend = ", ".join(f"{backend} {timings[backend]:.2f}s" for backend in jobs)
+    emit(f"[{per_backend}; total {timings['total']:.2f}s]", end="\n")
+    return timings
+
+
+def create_test_table(
+    name, ddb_eng, pg_eng, lite_eng, tables_dir="tables", prefix=None, transfer="arrow",
+    batch_rows=STREAM_BATCH_ROWS, cache_dir=None, **modes
+):
+    """
+    Create table <name> in all three databases. Drop existing table if any first. Get data from <tables_dir>/<name>.csv
+    modes are passed on to load_backends: pg_mode "copy" streams the data into Postgres with COPY ... FROM STDIN,
+    "to_sql" uses plain INSERTs. lite_mode "bulk" loads SQLite in one transaction with load-time PRAGMAs,
+    "to_sql" uses pandas. concurrent loads the three databases at the same time.
+    transfer "arrow" moves the data as a pyarrow Table, "pandas" as a DataFrame (see loaders.compare_transfer).
+    transfer "stream" loads DuckDB first, straight from the CSV, and then streams record batches of batch_rows rows
+    into the other databases; use it for tables that do not fit in memory (with the copy and bulk modes).
+    With a cache_dir the CSV is parsed once into a Parquet sidecar there and read from that while it is unchanged.
+    Warning:
+      - existing table will be dropped.
+      - constructing a query as f-string does not protect against SQL injection and is to be avoided in production code.
+    """
+    if transfer == "stream":
+        return _stream_test_table(name, ddb_eng, pg_eng, lite_eng, tables_dir, prefix, batch_rows, cache_dir, **modes)
+    table_data = read_csv(name, ddb_eng, tables_dir, transfer, cache_dir)
+    return load_backends(name, table_data, ddb_eng, pg_eng, lite_eng, prefix=prefix, **modes)
+
+
+def _stream_test_table(
+    name, ddb_eng, pg_eng, lite_eng, tables_dir, prefix, batch_rows, cache_dir, backends=None, version=None,
+    index_spec=indexes.INDEX_SPEC, **modes
+):
+    """The transfer="stream" part of create_test_table."""
+    version = version or time.time_ns()
+    duckdb_time = 0.0
+    if backends is None or "duckdb" in backends:
+        label, duckdb_time = _timed(load_duckdb_csv, name, ddb_eng, tables_dir, cache_dir, index_spec)
+        result_cache.set_table_version(ddb_eng, name, version)
+        if prefix is None:
+            print(f"{label}. ", end="")
+        else:
+            prefix = f"{prefix}{label}. "
+    others = [backend for backend in (backends or ("postgres", "sqlite")) if backend != "duckdb"]
+    timings = load_backends(
+        name, lambda: stream_table(name, ddb_eng, batch_rows), ddb_eng, pg_eng, lite_eng, prefix=prefix,
+        backends=others, version=version, index_spec=index_spec, **modes,
+    )
+    timings["duckdb"] = duckdb_time
+    timings["total"] += duckdb_time
+    return timings
+
+
+def csv_tables(tables_dir="tables"):
+    """List of (table name, file size) for every .csv file in tables_dir, largest file first."""
+    tables = []
+    for csv_file in os.listdir(tables_dir):
+        if csv_file.endswith(".csv"):
+            size = os.path.getsize(os.path.join(tables_dir, csv_file))
+            tables.append((os.path.splitext(csv_file)[0], size))
+    return sorted(tables, key=lambda table: table[1], reverse=True)
+
+
+def load_tables(
+    ddb_eng, pg_eng, lite_eng, tables_dir="tables", workers=4, incremental=False,
+    manifest_path="demo.manifest.json", index_spec=indexes.INDEX_SPEC, **modes
+):
+    """
+    Create a table in all three databases for every .csv file in tables_dir, with up to <workers> tables at a time.
+    The largest files are started first, so one big file does not end up loading on its own at the end.
+    Every worker thread gets its own DuckDB connection (a cursor on ddb_eng); a DuckDB connection must not be
+    shared between threads. The SQLAlchemy engines check out a separate pooled connection per load.
+    With incremental=True a table is only reloaded into the backends where the manifest at manifest_path says
+    it is stale: the CSV changed, or the table is missing or has a different schema than after the last load.
+    The data version of the tables (see result_cache) is then the CSV's sha256, so it is the same across runs.
+    Tables that are up to date still get the indexes of index_spec they lack, and the rollups they lack.
+    Returns a dict of table name -> timings as returned by load_backends, for the tables that were loaded.
+    """
+    engines = {"duckdb": ddb_eng, "postgres": pg_eng, "sqlite": lite_eng}
+    work = []
+    if incremental:
+        manifest = load_manifest.read_manifest(manifest_path)
+        for name, _size in csv_tables(tables_dir):
+            previous = manifest["tables"].get(name, {}).get("source")
+            fingerprint = load_manifest.source_fingerprint(os.path.join(tables_dir, f"{name}.csv"), previous)
+            stale = load_manifest.stale_backends(manifest, name, fingerprint, engines)
+            for backend in engines:
+                if backend not in stale:
+                    result_cache.set_table_version(engines[backend], name, fingerprint["sha256"])
+                    # Unchanged since it was loaded and analyzed; only indexes added to the spec are built.
+                    indexes.create_indexes(backend, name, engines[backend], index_spec, analyze=False)
+            if "duckdb" not in stale and name in rollups.ROLLUP_TABLES and not rollups.has_rollups(ddb_eng, name):
+                rollups.build_rollups(ddb_eng, name)
+            if stale:
+                work.append((name, fingerprint, stale))
+            else:
+                # Keep the new mtime if only the file was touched, so the next check skips hashing again.
+                manifest["tables"][name]["source"] = fingerprint
+                print(f"{name}: unchanged, skipped.")
+    else:
+        work = [(name, None, None) for name, _size in csv_tables(tables_dir)]
+
+    local = threading.local()
+    worker_cons = []
+    cons_lock = threading.Lock()
+
+    def worker_ddb():
+        if not hasattr(local, "ddb_con"):
+            local.ddb_con = ddb_eng.cursor()
+            with cons_lock:
+                worker_cons.append(local.ddb_con)
+        return local.ddb_con
+
+    def load_one(name, backends, version):
+        return create_test_table(
+            name, worker_ddb(), pg_eng, lite_eng, tables_dir=tables_dir, prefix=f"{name}: ", backends=backends,
+            version=version, index_spec=index_spec, **modes,
+        )
+
+    results = {}
+    start = time.perf_counter()
+    try:
+        # Evict the CSV cache once after all loads, not in between while other workers still read their sidecars.
+        with csv_cache.deferred_eviction(modes.get("cache_dir")), ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(load_one, name, stale, fingerprint and fingerprint["sha256"]): (name, fingerprint, stale)
+                for name, fingerprint, stale in work
+            }
+            for future in as_completed(futures):
+                name, fingerprint, stale = futures[future]
+                results[name] = future.result()
+                if incremental:
+                    load_manifest.record_load(manifest, name, fingerprint, {backend: engines[backend] for backend in stale})
+    finally:
+        for con in worker_cons:
+            con.close()
+        if incremental:
+            load_manifest.write_manifest(manifest_path, manifest)
+    print(f"Loaded {len(results)} tables with {workers} workers in {time.perf_counter() - start:.2f}s.")
+    return results
@@ -0,0 +1,219 @@
+"""
+Per-statement timings of the queries the notebook sends to its databases.
+
+Every statement is kept as a record in a ring buffer of the last RING_SIZE statements: the engine, the SQL,
+the total latency split into execute and fetch time, the number of rows and the bytes of the materialized result.
+  - SQLAlchemy engines (instrument_engine): the before/after_cursor_execute events time the execute part of every
+    statement, DDL and loads included. rows is the cursor's rowcount where the driver knows it.
+  - DuckDB (instrument_duckdb): DuckDB offers no per-statement hook, so only the statements run inside measure()
+    are recorded (the result cache and the benchmark do this). measure() switches JSON profiling on for the
+    connection for the duration of the block, to a file of its own, and restores the previous profiling settings
+    afterwards; the profile found in the file is that of the connection's last query in the block. Other queries
+    on the connection are not profiled and do not pay for it. Plain mo.sql cells on DuckDB do not show up in the
+    log. A cursor is a connection of its own; instrument.cursor() makes one that measure() records.
+measure() wraps a call that runs and fetches one query (ResultCache.sql does this): the fetch time is the rest of
+the wall time after execute, and rows and bytes are taken from the result it returns.
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+import weakref
+from collections import deque
+from contextlib import contextmanager
+
+from demo_db.lazy_imports import lazy_module
+
+# The notebook instruments its engines at startup; these are only needed once the first query is measured.
+dialects = lazy_module("demo_db.dialects")
+pl = lazy_module("polars")
+sa = lazy_module("sqlalchemy")
+
+RING_SIZE = 1000
+SQL_PREVIEW_CHARS = 200
+
+_records = deque(maxlen=RING_SIZE)
+_records_lock = threading.Lock()
+_instrumented = weakref.WeakKeyDictionary()
+_local = threading.local()
+_profile_dir = None
+# The DuckDB settings measure() changes, in the order they are restored (profiling off first).
+_PROFILING = ("enable_profiling", "profiling_output", "profiling_mode")
+
+
+def _preview(sql):
+    text = " ".join(sql.split())
+    return text if len(text) <= SQL_PREVIEW_CHARS else text[:SQL_PREVIEW_CHARS - 1] + "…"
+
+
+def _add(engine_name, sql, execute_s, rows=None):
+    """Append a new record to the ring buffer (and to the statements of the active measure() in this thread)."""
+    record = {
+        "time": time.time(),
+        "engine": engine_name,
+        "sql": _preview(sql),
+        "latency_ms": round(execute_s * 1000, 3),
+        "execute_ms": round(execute_s * 1000, 3),
+        "fetch_ms": None,
+        "rows": rows,
+        "bytes": None,
+    }
+    with _records_lock:
+        _records.append(record)
+    pending = getattr(_local, "pending", None)
+    if pending is not None:
+        pending.append(record)
+    return record
+
+
+def instrument_engine(engine, name):
+    """Record every statement executed through the SQLAlchemy engine under name. Instruments an engine only once."""
+    if engine in _instrumented:
+        return engine
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        execute_s = time.perf_counter() - conn.info["query_start"].pop()
+        rowcount = getattr(cursor, "rowcount", -1)
+        _add(name, statement, execute_s, rowcount if rowcount is not None and rowcount >= 0 else None)
+
+    sa.event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    sa.event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    _instrumented[engine] = name
+    return engine
+
+
+def _profile_path(ddb_eng):
+    """File the DuckDB connection writes its profiles to, in a directory of this process."""
+    global _profile_dir
+    if _profile_dir is None:
+        _profile_dir = tempfile.mkdtemp(prefix="duckdb_profiles_")
+    return os.path.join(_profile_dir, f"{id(ddb_eng)}.json")
+
+
+def instrument_duckdb(ddb_eng, name="duckdb"):
+    """Record the statements measure() runs on the DuckDB connection under name."""
+    _instrumented[ddb_eng] = (name, _profile_path(ddb_eng))
+    return ddb_eng
+
+
+def _profiling_on(ddb_eng, path):
+    """Switch JSON profiling to the file path on for the DuckDB connection. Returns the previous settings."""
+    previous = {
+        setting: ddb_eng.execute(f"SELECT current_setting('{setting}')").fetchone()[0] for setting in _PROFILING
+    }
+    ddb_eng.execute(f"SET profiling_output = '{path}'")
+    ddb_eng.execute("SET profiling_mode = 'standard'")
+    ddb_eng.execute("SET enable_profiling = 'json'")
+    return previous
+
+
+def _restore_profiling(ddb_eng, previous):
+    """Put the profiling settings of the DuckDB connection back as _profiling_on() found them."""
+    for setting in _PROFILING:
+        value = previous[setting]
+        if value is None or value == "":
+            ddb_eng.execute(f"RESET {setting}")
+        else:
+            ddb_eng.execute(f"SET {setting} = '{value}'")
+
+
+def cursor(ddb_eng):
+    """New cursor on the DuckDB connection, recorded by measure() when the connection is instrumented."""
+    cur = ddb_eng.cursor()
+    instrumented = _instrumented.get(ddb_eng)
+    return cur if instrumented is None else instrument_duckdb(cur, instrumented[0])
+
+
+def _result_size(result):
+    """(rows, bytes) of a query result: polars or pandas DataFrame, pyarrow Table or list of rows."""
+    if isinstance(result, pl.DataFrame):
+        return result.height, result.estimated_size()
+    if hasattr(result, "memory_usage"):  # pandas
+        return len(result), int(result.memory_usage(deep=True).sum())
+    if hasattr(result, "nbytes"):
+        return result.num_rows, result.nbytes
+    return (len(result), None) if result is not None else (None, None)
+
+
+class _Measurement:
+    result = None
+
+
+@contextmanager
+def measure(engine, sql):
+    """
+    Time the query sql on engine run inside the with block, which sets .result on the yielded object:
+
+        with instrument.measure(engine, sql) as m:
+            m.result = mo.sql(sql, engine=engine, output=False)
+
+    Completes the record of the statement (or adds one for DuckDB) with fetch time, rows and bytes.
+    Engines that are not instrumented are not recorded.
+    """
+    instrumented = _instrumented.get(engine)
+    measurement = _Measurement()
+    if instrumented is None:
+        yield measurement
+        return
+    is_duckdb = dialects.engine_dialect(engine) == "duckdb"
+    name, profile_path = instrumented if is_duckdb else (instrumented, None)
+    if is_duckdb:
+        if os.path.exists(profile_path):
+            os.remove(profile_path)
+        previous = _profiling_on(engine, profile_path)
+    outer, _local.pending = getattr(_local, "pending", None), []
+    start = time.perf_counter()
+    try:
+        yield measurement
+    finally:
+        total_s = time.perf_counter() - start
+        statements, _local.pending = _local.pending, outer
+        if is_duckdb:
+            execute_s = _duckdb_latency(profile_path)
+            _restore_profiling(engine, previous)
+    if is_duckdb:
+        record = _add(name, sql, total_s if execute_s is None else min(execute_s, total_s))
+    elif statements:
+        record = statements[-1]
+    else:
+        return
+    rows, nbytes = _result_size(measurement.result)
+    execute_ms = record["execute_ms"]
+    record.update(
+        latency_ms=round(max(total_s * 1000, execute_ms), 3),
+        fetch_ms=round(max(total_s * 1000 - execute_ms, 0.0), 3),
+        rows=rows if rows is not None else record["rows"],
+        bytes=nbytes,
+    )
+
+
+def _duckdb_latency(profile_path):
+    """Latency in seconds from the JSON profile file of a DuckDB connection; None when no query wrote one."""
+    try:
+        with open(profile_path) as f:
+            info = json.load(f)
+    except (OSError, ValueError):
+        return None
+    os.remove(profile_path)
+    return info.get("latency")
+
+
+def records():
+    """Snapshot of the records in the ring buffer, oldest first."""
+    with _records_lock:
+        return list(_records)
+
+
+def slowest(n=10):
+    """The n records with the highest latency."""
+    return sorted(records(), key=lambda record: record["latency_ms"], reverse=True)[:n]
+
+
+def clear():
+    """Empty the ring buffer."""
+    with _records_lock:
+        _records.clear()
@@ -0,0 +1,108 @@
+"""
+Lazy imports for the notebooks.
+
+`sa = lazy_module("sqlalchemy")` gives a stand-in module that imports sqlalchemy on the first attribute access,
+so a heavy package is only loaded when the first cell that uses it runs, not when the import cell does.
+startup_profile() measures what that saves where a user notices it: the time from starting Python until given
+cells have run (the first rendered cell, the engines being ready), eager versus lazy, and the import time per module.
+Deferring only moves an import to the first cell that uses the module; cells that run at startup still pay for it.
+"""
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+import types
+
+# Seconds each lazy module took to import on first use, in this process.
+import_times = {}
+_import_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """Module stand-in that imports the real module on first attribute access."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self.__dict__["_lazy_target"] = None
+
+    def _load(self):
+        target = self.__dict__["_lazy_target"]
+        if target is None:
+            with _import_lock:
+                target = self.__dict__["_lazy_target"]
+                if target is None:
+                    start = time.perf_counter()
+                    target = importlib.import_module(self.__name__)
+                    import_times[self.__name__] = time.perf_counter() - start
+                    self.__dict__["_lazy_target"] = target
+        return target
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_lazy_target"] is not None else "not loaded"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+
+def lazy_module(name):
+    """The module name if it is imported already, else a LazyModule for it."""
+    return sys.modules.get(name) or LazyModule(name)
+
+
+def _run_stages(stages):
+    """
+    Run the (label, statement) pairs of stages one after another in a fresh Python process, with -X importtime.
+    Returns the seconds from launching the process to the end of every stage, and the cumulative import time
+    (seconds) of every module it imported.
+    """
+    env = dict(os.environ)
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [package_dir, env.get("PYTHONPATH")]))
+    script = (
+        "import sys, time\n"
+        f"for _label, _statement in {list(stages)!r}:\n"
+        "    exec(_statement)\n"
+        "    print(f'{_label}\\t{time.time()}', flush=True)\n"
+    )
+    launched = time.time()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script], env=env, capture_output=True, text=True, check=True
+    )
+    elapsed = {}
+    for line in proc.stdout.splitlines():
+        label, _, finished = line.rpartition("\t")
+        if label in dict(stages):
+            elapsed[label] = float(finished) - launched
+    cumulative = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cumulative_us) / 1e6
+    return elapsed, cumulative
+
+
+def startup_profile(eager_stages, lazy_stages):
+    """
+    Compare two versions of a notebook's start, each run in a fresh Python process.
+    eager_stages and lazy_stages are lists of (label, statement), e.g. the import cell, the first cell that
+    renders output and the cells that set up the engines; the statements of one version share their namespace.
+    Returns {"eager": ..., "lazy": ...}, each with the seconds from process launch to the end of every stage
+    (what a user waits for that cell) and the cumulative import time of every top level module imported,
+    largest first.
+    """
+    profile = {}
+    for label, stages in (("eager", eager_stages), ("lazy", lazy_stages)):
+        elapsed, cumulative = _run_stages(stages)
+        top_level = {name: seconds for name, seconds in cumulative.items() if "." not in name}
+        profile[label] = {
+            "stages": elapsed,
+            "modules": dict(sorted(top_level.items(), key=lambda item: item[1], reverse=True)),
+        }
+    return profile
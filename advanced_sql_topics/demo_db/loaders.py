@@ -0,0 +1,286 @@
+"""
+Bulk loaders that push a table into the demo databases.
+
+The plain way is `DataFrame.to_sql`, which sends (batched) INSERT statements. That is fine for the
+few rows in tables/, but far too slow for real sensor extracts. The loaders here use the fast path
+each engine offers and fall back to `to_sql` when that path is not available.
+
+Every loader comes in two flavours: one taking a pandas DataFrame and one taking Arrow data (a
+pyarrow Table or RecordBatchReader, as returned by DuckDB's fetch_arrow_table / fetch_record_batch).
+The Arrow flavour never converts to pandas object columns.
+SQLite stores timestamps as text. Every path into SQLite, including the stand-in for Postgres, writes the same
+text, that of str(pandas.Timestamp), so the same table holds the same strings whichever loader filled it.
+"""
+import io
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import sqlalchemy as sa
+
+from demo_db import schemas
+
+COPY_CHUNK_ROWS = 100_000
+
+
+def _chunks(table_df, chunk_rows):
+    """Yield consecutive row slices of table_df with at most chunk_rows rows each."""
+    for start in range(0, len(table_df), chunk_rows):
+        yield table_df.iloc[start:start + chunk_rows]
+
+
+def _arrow_batches(table_data, chunk_rows):
+    """Yield the record batches of a pyarrow Table (at most chunk_rows rows each) or RecordBatchReader."""
+    if isinstance(table_data, pa.Table):
+        yield from table_data.to_batches(max_chunksize=chunk_rows)
+    else:
+        yield from table_data
+
+
+def _sa_type(arrow_type):
+    """SQLAlchemy column type for an Arrow type."""
+    if pa.types.is_boolean(arrow_type):
+        return sa.Boolean()
+    if pa.types.is_integer(arrow_type):
+        return sa.BigInteger()
+    if pa.types.is_floating(arrow_type) or pa.types.is_decimal(arrow_type):
+        return sa.Float()
+    if pa.types.is_timestamp(arrow_type):
+        return sa.DateTime()
+    if pa.types.is_date(arrow_type):
+        return sa.Date()
+    return sa.Text()
+
+
+def create_table_from_arrow(schema, name, engine):
+    """
+    Create the empty table <name> in engine, with its declared schema (see schemas) or else a column per field
+    of the Arrow schema.
+    """
+    if schemas.create_table(name, engine):
+        return
+    metadata = sa.MetaData()
+    sa.Table(name, metadata, *(sa.Column(field.name, _sa_type(field.type)) for field in schema))
+    metadata.create_all(engine)
+
+
+def can_copy(engine):
+    """True when engine talks to PostgreSQL through psycopg2, so COPY ... FROM STDIN is available."""
+    return engine.dialect.name == "postgresql" and engine.dialect.driver == "psycopg2"
+
+
+def _copy_buffers(name, columns, buffers, pg_eng):
+    """Send each CSV text buffer in buffers to table <name> with COPY ... FROM STDIN, all in one transaction."""
+    column_list = ", ".join(f'"{col}"' for col in columns)
+    sql = f'COPY "{name}" ({column_list}) FROM STDIN WITH (FORMAT csv)'
+    raw_con = pg_eng.raw_connection()
+    try:
+        with raw_con.cursor() as cur:
+            for buf in buffers:
+                cur.copy_expert(sql, buf)
+        raw_con.commit()
+    finally:
+        raw_con.close()
+
+
+def copy_to_postgres(table_df, name, pg_eng, chunk_rows=COPY_CHUNK_ROWS):
+    """
+    Load table_df into table <name> with COPY ... FROM STDIN. The table must not exist yet.
+    The data is sent in chunks of chunk_rows rows, so only one chunk is rendered to CSV text at a time.
+    Engines that cannot COPY get a plain `to_sql`, a SQLite stand-in bulk_load_sqlite.
+    Returns the number of rows per second.
+    """
+    if pg_eng.dialect.name == "sqlite":
+        return bulk_load_sqlite(table_df, name, pg_eng)
+    start = time.perf_counter()
+    if not can_copy(pg_eng):
+        if_exists = "append" if schemas.create_table(name, pg_eng) else "fail"
+        table_df.to_sql(name, pg_eng, index=False, if_exists=if_exists)
+        return len(table_df) / max(time.perf_counter() - start, 1e-9)
+
+    def buffers():
+        for chunk in _chunks(table_df, chunk_rows):
+            buf = io.StringIO()
+            chunk.to_csv(buf, index=False, header=False)
+            buf.seek(0)
+            yield buf
+
+    # Create the empty table (pandas picks the column types of tables without a schema), then fill it with COPY.
+    if not schemas.create_table(name, pg_eng):
+        table_df.head(0).to_sql(name, pg_eng, index=False)
+    _copy_buffers(name, table_df.columns, buffers(), pg_eng)
+    return len(table_df) / max(time.perf_counter() - start, 1e-9)
+
+
+def copy_arrow_to_postgres(table_data, name, pg_eng, chunk_rows=COPY_CHUNK_ROWS):
+    """
+    Load Arrow table_data into table <name> with COPY ... FROM STDIN. The table must not exist yet.
+    Every record batch is rendered to CSV by pyarrow and sent on its own, so only one batch is held as text.
+    Engines that cannot COPY get a plain `to_sql` per batch, a SQLite stand-in bulk_load_sqlite_arrow.
+    Returns the number of rows per second.
+    """
+    if pg_eng.dialect.name == "sqlite":
+        return bulk_load_sqlite_arrow(table_data, name, pg_eng, chunk_rows=chunk_rows)
+    start = time.perf_counter()
+    create_table_from_arrow(table_data.schema, name, pg_eng)
+    n_rows = 0
+
+    def buffers():
+        nonlocal n_rows
+        for batch in _arrow_batches(table_data, chunk_rows):
+            buf = io.BytesIO()
+            pa_csv.write_csv(batch, buf, pa_csv.WriteOptions(include_header=False))
+            buf.seek(0)
+            n_rows += batch.num_rows
+            yield buf
+
+    if can_copy(pg_eng):
+        _copy_buffers(name, table_data.schema.names, buffers(), pg_eng)
+    else:
+        for batch in _arrow_batches(table_data, chunk_rows):
+            batch.to_pandas().to_sql(name, pg_eng, index=False, if_exists="append")
+            n_rows += batch.num_rows
+    return n_rows / max(time.perf_counter() - start, 1e-9)
+
+
+def _timestamp_text(series):
+    """A pandas timestamp column as a list of the text str(Timestamp) gives, None for NaT."""
+    return [None if ts is None else str(ts) for ts in series.astype(object).where(series.notna(), None)]
+
+
+def sqlite_frame(table_df):
+    """table_df with its timestamp columns as the text the other SQLite loaders write, for a to_sql into SQLite."""
+    return table_df.assign(
+        **{col: _timestamp_text(table_df[col]) for col in table_df.columns if table_df[col].dtype.kind == "M"}
+    )
+
+
+def _sqlite_rows(table_df):
+    """Rows of table_df as plain Python tuples, with NULLs as None and timestamps as text like str(Timestamp)."""
+    out_df = table_df.astype(object).where(table_df.notna(), None)
+    for col in table_df.columns:
+        if table_df[col].dtype.kind == "M":
+            out_df[col] = _timestamp_text(table_df[col])
+    return out_df.itertuples(index=False, name=None)
+
+
+def _arrow_timestamp_text(col):
+    """
+    Arrow timestamps as the text str(pandas.Timestamp) gives, so both load paths write the same: the fraction of the
+    second only when it is not zero, with 6 digits or, for nanoseconds, 9; the UTC offset as +HH:MM.
+    """
+    tz = col.type.tz is not None
+    text = pc.strftime(col.cast(pa.timestamp("ns", col.type.tz)), format="%Y-%m-%d %H:%M:%S" + ("%z" if tz else ""))
+    text = pc.replace_substring_regex(text, pattern=r"\.0{9}([+-]\d{4})?$", replacement=r"\1")
+    text = pc.replace_substring_regex(text, pattern=r"(\.\d{6})000([+-]\d{4})?$", replacement=r"\1\2")
+    if tz:
+        text = pc.replace_substring_regex(text, pattern=r"([+-]\d{2})(\d{2})$", replacement=r"\1:\2")
+    return text
+
+
+def _arrow_sqlite_rows(batches):
+    """Rows of the Arrow record batches as plain Python tuples, with timestamps as text like _sqlite_rows writes them."""
+    for batch in batches:
+        columns = []
+        for col in batch.columns:
+            if pa.types.is_timestamp(col.type):
+                col = _arrow_timestamp_text(col)
+            columns.append(col.to_pylist())
+        yield from zip(*columns)
+
+
+def _sqlite_bulk_insert(name, columns, rows, lite_eng, indexes):
+    """
+    Insert rows into the existing table <name> with a single executemany in one transaction, with
+    journal_mode=WAL and synchronous=OFF for the duration of the load. The previous settings are restored
+    afterwards. indexes is an iterable of column tuples; those indexes are built after the data is in.
+    """
+    column_list = ", ".join(f'"{col}"' for col in columns)
+    params = ", ".join("?" for _ in columns)
+
+    raw_con = lite_eng.raw_connection()
+    try:
+        cur = raw_con.cursor()
+        journal_mode = cur.execute("PRAGMA journal_mode").fetchone()[0]
+        synchronous = cur.execute("PRAGMA synchronous").fetchone()[0]
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=OFF")
+        try:
+            cur.execute("BEGIN")
+            cur.executemany(f'INSERT INTO "{name}" ({column_list}) VALUES ({params})', rows)
+            for index_cols in indexes:
+                index_name = f"ix_{name}_{'_'.join(index_cols)}"
+                cur.execute(f'CREATE INDEX "{index_name}" ON "{name}" ({", ".join(index_cols)})')
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        finally:
+            cur.execute(f"PRAGMA synchronous={synchronous}")
+            cur.execute(f"PRAGMA journal_mode={journal_mode}")
+            cur.close()
+    finally:
+        raw_con.close()
+
+
+def bulk_load_sqlite(table_df, name, lite_eng, indexes=()):
+    """
+    Load table_df into table <name> in SQLite. The table must not exist yet.
+    All rows go in with one executemany inside a single transaction, with journal_mode=WAL and
+    synchronous=OFF for the duration of the load. The previous settings are restored afterwards.
+    indexes is an iterable of column tuples; those indexes are built after the data is in.
+    Returns the number of rows per second.
+    """
+    start = time.perf_counter()
+    if not schemas.create_table(name, lite_eng):
+        table_df.head(0).to_sql(name, lite_eng, index=False)
+    _sqlite_bulk_insert(name, table_df.columns, _sqlite_rows(table_df), lite_eng, indexes)
+    return len(table_df) / max(time.perf_counter() - start, 1e-9)
+
+
+def bulk_load_sqlite_arrow(table_data, name, lite_eng, indexes=(), chunk_rows=COPY_CHUNK_ROWS):
+    """
+    Load Arrow table_data into table <name> in SQLite, the same way as bulk_load_sqlite.
+    The rows are produced batch by batch while executemany consumes them.
+    Returns the number of rows per second.
+    """
+    start = time.perf_counter()
+    create_table_from_arrow(table_data.schema, name, lite_eng)
+    n_rows = 0
+
+    def counted(batches):
+        nonlocal n_rows
+        for batch in batches:
+            n_rows += batch.num_rows
+            yield batch
+
+    rows = _arrow_sqlite_rows(counted(_arrow_batches(table_data, chunk_rows)))
+    _sqlite_bulk_insert(name, table_data.schema.names, rows, lite_eng, indexes)
+    return n_rows / max(time.perf_counter() - start, 1e-9)
+
+
+def compare_transfer(ddb_eng, name):
+    """
+    Fetch table <name> from DuckDB once with fetchdf() and once with fetch_arrow_table() and measure both.
+    Returns a dict per path with the fetch time in seconds and the memory held by the result in bytes
+    (pandas memory_usage(deep=True), so object columns count with their Python strings; Arrow nbytes).
+    """
+    cur = ddb_eng.cursor()
+    try:
+        start = time.perf_counter()
+        table_df = cur.execute(f"SELECT * FROM {name}").fetchdf()
+        pandas_time = time.perf_counter() - start
+        pandas_bytes = int(table_df.memory_usage(index=False, deep=True).sum())
+        del table_df
+
+        start = time.perf_counter()
+        table = cur.execute(f"SELECT * FROM {name}").fetch_arrow_table()
+        arrow_time = time.perf_counter() - start
+        arrow_bytes = table.nbytes
+    finally:
+        cur.close()
+    return {
+        "pandas": {"seconds": pandas_time, "bytes": pandas_bytes},
+        "arrow": {"seconds": arrow_time, "bytes": arrow_bytes},
+    }
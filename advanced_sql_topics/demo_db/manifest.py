@@ -0,0 +1,101 @@
+"""
+Load manifest for incremental table loading.
+
+For every table the manifest records a fingerprint of its source CSV (sha256, size, mtime) and, per backend,
+which source was loaded, with which declared schema (see schemas), and the resulting table schema. A backend
+only needs a reload when the CSV content or the declared schema changed, or the table is gone or was altered
+since the last load (e.g. a fresh Postgres container).
+"""
+import hashlib
+import json
+import os
+
+import sqlalchemy as sa
+
+from demo_db import schemas
+
+MANIFEST_VERSION = 1
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def read_manifest(path):
+    """The manifest stored at path, or an empty one if there is none (or it is from another version)."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        manifest = {}
+    if manifest.get("version") != MANIFEST_VERSION:
+        manifest = {"version": MANIFEST_VERSION, "tables": {}}
+    return manifest
+
+
+def write_manifest(path, manifest):
+    """Write the manifest to path. Writes a temporary file first, so an interrupted run never leaves half a manifest."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def source_fingerprint(path, previous=None):
+    """
+    sha256, size and mtime of the file at path.
+    When size and mtime equal those in previous, the file is assumed unchanged and previous is returned without
+    hashing, so checking an unchanged tables directory only costs a stat per file.
+    """
+    st = os.stat(path)
+    if previous and previous["size"] == st.st_size and previous["mtime_ns"] == st.st_mtime_ns:
+        return previous
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(HASH_BLOCK_SIZE):
+            sha.update(block)
+    return {"sha256": sha.hexdigest(), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def table_schema(backend, name, engine):
+    """List of [column, type] of table <name> in the backend, or None when the table does not exist."""
+    if backend == "duckdb":
+        cur = engine.cursor()
+        try:
+            rows = cur.execute(
+                "SELECT column_name, data_type FROM information_schema.columns "
+                "WHERE table_name = ? ORDER BY ordinal_position",
+                [name],
+            ).fetchall()
+        finally:
+            cur.close()
+        return [list(row) for row in rows] or None
+    inspector = sa.inspect(engine)
+    if not inspector.has_table(name):
+        return None
+    return [[col["name"], str(col["type"])] for col in inspector.get_columns(name)]
+
+
+def stale_backends(manifest, name, fingerprint, engines):
+    """Names of the backends in engines ({backend: engine}) whose table <name> has to be (re)loaded."""
+    entries = manifest["tables"].get(name, {}).get("backends", {})
+    stale = []
+    for backend, engine in engines.items():
+        entry = entries.get(backend)
+        if (
+            entry is None
+            or entry["sha256"] != fingerprint["sha256"]
+            or entry.get("declared") != schemas.SCHEMAS.get(name)
+            or entry["schema"] != table_schema(backend, name, engine)
+        ):
+            stale.append(backend)
+    return stale
+
+
+def record_load(manifest, name, fingerprint, engines):
+    """Note in the manifest that table <name> was loaded from fingerprint into the backends in engines."""
+    table = manifest["tables"].setdefault(name, {"backends": {}})
+    table["source"] = fingerprint
+    for backend, engine in engines.items():
+        table["backends"][backend] = {
+            "sha256": fingerprint["sha256"],
+            "declared": schemas.SCHEMAS.get(name),
+            "schema": table_schema(backend, name, engine),
+        }
@@ -0,0 +1,213 @@
+"""
+Query results fetched page by page, as they are looked at.
+
+mo.sql fetches the whole result into a DataFrame before the cell shows anything; for a cross join of two large
+tables that is the product of their sizes. LazyResult runs the query with a cursor that streams the result
+instead: DuckDB hands out record batches (fetch_record_batch), Postgres gets a server-side cursor
+(stream_results) and SQLite steps through its cursor with fetchmany. The first page is fetched right away,
+every further page only when page() asks for it; pages already fetched are kept so they can be shown again.
+For downstream cells a result is also available as
+  - lazy(): a polars LazyFrame; collecting it runs the query again, applies column selections and filters per
+    page and, for a head() without a filter, stops fetching once it has the rows (polars passes no row limit to
+    the scan when a filter comes first, so then all pages are read),
+  - iter_batches(): a pyarrow RecordBatchReader over a fresh run of the query.
+A result that is not read to the end holds its cursor, and on the SQLAlchemy engines a pooled connection (on
+Postgres an open transaction, on SQLite a read lock), until it is closed: use close() or a with block. Loads and
+index changes on the same tables wait for it, or fail with "database is locked" on SQLite. As a safety net the
+cursor is also closed when the result is garbage collected, and latest_result() closes the result a cell made on
+its previous run.
+On the SQLAlchemy engines the column types come from the cursor description where the driver reports them
+(Postgres type OIDs), otherwise from the values of the first page; a column without a reported type that is NULL
+throughout the first page (SQLite reports none) becomes a String column. Later pages are cast to these types.
+"""
+import threading
+import time
+import weakref
+
+import polars as pl
+import pyarrow as pa
+from polars.io.plugins import register_io_source
+
+from demo_db import dialects
+
+PAGE_ROWS = 1000
+
+_latest = {}
+_latest_lock = threading.Lock()
+
+# Postgres type OIDs as reported in cursor.description, for the types with an unambiguous polars type.
+_PG_TYPES = {
+    16: pl.Boolean, 20: pl.Int64, 21: pl.Int64, 23: pl.Int64, 700: pl.Float64, 701: pl.Float64,
+    25: pl.String, 1042: pl.String, 1043: pl.String, 1082: pl.Date, 1114: pl.Datetime("us"),
+    1184: pl.Datetime("us", "UTC"),
+}
+
+
+def _unique_names(names):
+    """Column names with repeated names numbered (x, x_1, x_2), as a self join gives them more than once."""
+    seen = {}
+    unique = []
+    for name in names:
+        count = seen.get(name, 0)
+        seen[name] = count + 1
+        unique.append(name if count == 0 else f"{name}_{count}")
+    return unique
+
+
+def _described_types(description):
+    """polars type per column of a DBAPI cursor description, None where the driver reports no known type."""
+    return [_PG_TYPES.get(column[1]) if isinstance(column[1], int) else None for column in description or ()]
+
+
+def stream_pages(sql, engine, page_rows=PAGE_ROWS, schema=None):
+    """
+    Generator of the result of sql on engine (DuckDB connection or SQLAlchemy engine) as polars DataFrames of at
+    most page_rows rows, each fetched when it is asked for. Yields one empty DataFrame for an empty result.
+    On the SQLAlchemy engines the pages are cast to schema, by default the types the cursor reports, completed
+    from the values of the first page.
+    Closing the generator closes the cursor.
+    """
+    if dialects.engine_dialect(engine) == "duckdb":
+        cur = engine.cursor()
+        try:
+            reader = cur.execute(sql).fetch_record_batch(page_rows)
+            columns = _unique_names(reader.schema.names)
+            empty = True
+            for batch in reader:
+                empty = False
+                yield pl.from_arrow(batch.rename_columns(columns))
+            if empty:
+                yield pl.from_arrow(reader.schema.empty_table().rename_columns(columns))
+        finally:
+            cur.close()
+        return
+    with engine.connect() as con:
+        result = con.execution_options(stream_results=True, yield_per=page_rows).exec_driver_sql(sql)
+        columns = _unique_names(result.keys())
+        described = dict(zip(columns, _described_types(result.cursor.description)))
+        schema = dict(schema) if schema is not None else None
+        while True:
+            rows = result.fetchmany(page_rows)
+            if not rows and schema is not None:
+                break
+            page = pl.DataFrame([tuple(row) for row in rows], schema=columns, orient="row", infer_schema_length=None)
+            if schema is None:
+                schema = {
+                    col: described.get(col) or (pl.String if dtype == pl.Null else dtype)
+                    for col, dtype in page.schema.items()
+                }
+            if page.schema != schema:
+                page = page.cast(schema, strict=False)
+            yield page
+            if not rows:
+                break
+
+
+class LazyResult:
+    """
+    Result of sql on engine, fetched page_rows rows at a time. The first page is fetched on construction
+    (first_page_ms is how long that took). Call close(), or use a with block, when the result may not be read to
+    the end: that releases the cursor and connection (see the module doc).
+    """
+
+    def __init__(self, sql, engine, page_rows=PAGE_ROWS):
+        self.sql = sql
+        self.engine = engine
+        self.page_rows = page_rows
+        self.exhausted = False
+        self._pages = []
+        self._stream = stream_pages(sql, engine, page_rows)
+        # Closes the cursor when the result is garbage collected without close().
+        self._finalizer = weakref.finalize(self, self._stream.close)
+        start = time.perf_counter()
+        self._fetch()
+        self.first_page_ms = (time.perf_counter() - start) * 1000
+        self.schema = self._pages[0].schema
+
+    def _fetch(self):
+        """Fetch the next page from the cursor. Returns False when the result is read to the end."""
+        if self.exhausted:
+            return False
+        page = next(self._stream, None)
+        if page is None or (page.height == 0 and self._pages):
+            self.close()
+            return False
+        self._pages.append(page)
+        if page.height < self.page_rows:
+            self.close()
+        return True
+
+    def page(self, number):
+        """Page number (0 based) as a polars DataFrame, fetching the pages up to it; empty past the end."""
+        while len(self._pages) <= number and self._fetch():
+            pass
+        if number < len(self._pages):
+            return self._pages[number]
+        return pl.DataFrame(schema=self.schema)
+
+    @property
+    def fetched_pages(self):
+        return len(self._pages)
+
+    @property
+    def fetched_rows(self):
+        return sum(page.height for page in self._pages)
+
+    def close(self):
+        """Close the cursor; the pages fetched so far stay available."""
+        self.exhausted = True
+        self._finalizer()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def lazy(self):
+        """polars LazyFrame over the result. Every collect runs the query again (see the module doc for how far)."""
+
+        def source(with_columns, predicate, n_rows, batch_size):
+            pages = stream_pages(self.sql, self.engine, batch_size or self.page_rows, self.schema)
+            remaining = n_rows
+            try:
+                for page in pages:
+                    if with_columns is not None:
+                        page = page.select(with_columns)
+                    if predicate is not None:
+                        page = page.filter(predicate)
+                    if remaining is not None:
+                        page = page.head(remaining)
+                        remaining -= page.height
+                    yield page
+                    if remaining == 0:
+                        break
+            finally:
+                pages.close()
+
+        return register_io_source(source, schema=self.schema)
+
+    def iter_batches(self):
+        """pyarrow RecordBatchReader over a fresh run of the query, page_rows rows per batch."""
+        schema = self._pages[0].to_arrow().schema
+
+        def batches():
+            for page in stream_pages(self.sql, self.engine, self.page_rows, self.schema):
+                yield from page.to_arrow().cast(schema).to_batches()
+
+        return pa.RecordBatchReader.from_batches(schema, batches())
+
+
+def latest_result(name, sql, engine, page_rows=PAGE_ROWS):
+    """
+    LazyResult of sql on engine, kept under name until the next call with the same name, which closes it first.
+    A cell that makes its result with this releases the cursor of its previous run when it runs again.
+    """
+    with _latest_lock:
+        previous = _latest.pop(name, None)
+    if previous is not None:
+        previous.close()
+    result = LazyResult(sql, engine, page_rows)
+    with _latest_lock:
+        _latest[name] = result
+    return result
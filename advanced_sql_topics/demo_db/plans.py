@@ -0,0 +1,131 @@
+"""
+Query plans of the same query on DuckDB, PostgreSQL and SQLite, side by side.
+
+DuckDB and Postgres run the query with EXPLAIN ANALYZE and report per operator the rows the planner estimated,
+the rows it actually produced and the time spent. SQLite only has EXPLAIN QUERY PLAN: the chosen access paths
+(scans, index searches, temp B-trees for sorts), without estimates or timings, so the query is also run once
+to report its total time. All plans are flattened to one row per operator with its depth in the tree.
+"""
+import json
+import time
+
+import sqlalchemy as sa
+
+from demo_db import benchmark, dialects
+
+
+def _duckdb_rows(node, depth, rows):
+    """Operator rows of a DuckDB JSON profile node and its children."""
+    extra = node.get("extra_info") or {}
+    estimated = extra.get("Estimated Cardinality") if isinstance(extra, dict) else None
+    rows.append(
+        {
+            "depth": depth,
+            "operator": "  " * depth + node.get("operator_name", node.get("operator_type", "?")).strip(),
+            "estimated_rows": int(estimated.lstrip("~")) if estimated else None,
+            "actual_rows": node.get("operator_cardinality"),
+            "ms": round(node.get("operator_timing", 0.0) * 1000, 3),
+        }
+    )
+    for child in node.get("children", []):
+        _duckdb_rows(child, depth + 1, rows)
+    return rows
+
+
+def explain_duckdb(sql, ddb_eng):
+    """Operator rows and total time in ms of sql on DuckDB, from EXPLAIN (ANALYZE, FORMAT JSON)."""
+    cur = ddb_eng.cursor()
+    try:
+        start = time.perf_counter()
+        profile = json.loads(cur.execute(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}").fetchall()[0][1])
+        total_ms = (time.perf_counter() - start) * 1000
+    finally:
+        cur.close()
+    rows = []
+    for child in profile.get("children", []):
+        # The root is the EXPLAIN_ANALYZE operator itself.
+        for node in child.get("children", []) if child.get("operator_type") == "EXPLAIN_ANALYZE" else [child]:
+            _duckdb_rows(node, 0, rows)
+    return rows, total_ms
+
+
+def _postgres_rows(node, depth, rows):
+    """Operator rows of a Postgres JSON plan node and its sub plans."""
+    label = node["Node Type"]
+    if "Relation Name" in node:
+        label += f" on {node['Relation Name']}"
+    if "Index Name" in node:
+        label += f" using {node['Index Name']}"
+    loops = node.get("Actual Loops", 1)
+    rows.append(
+        {
+            "depth": depth,
+            "operator": "  " * depth + label,
+            "estimated_rows": node.get("Plan Rows"),
+            # Actual rows and time are averages per loop.
+            "actual_rows": None if "Actual Rows" not in node else round(node["Actual Rows"] * loops),
+            "ms": None if "Actual Total Time" not in node else round(node["Actual Total Time"] * loops, 3),
+        }
+    )
+    for child in node.get("Plans", []):
+        _postgres_rows(child, depth + 1, rows)
+    return rows
+
+
+def explain_postgres(sql, pg_eng):
+    """Operator rows and total (execution) time in ms of sql on Postgres, from EXPLAIN (ANALYZE, FORMAT JSON)."""
+    with pg_eng.connect() as con:
+        result = con.execute(sa.text(f"EXPLAIN (ANALYZE, FORMAT JSON) {sql}")).scalar()
+        con.rollback()  # EXPLAIN ANALYZE really executes the statement.
+    plan = (json.loads(result) if isinstance(result, str) else result)[0]
+    return _postgres_rows(plan["Plan"], 0, []), plan.get("Execution Time")
+
+
+def explain_sqlite(sql, lite_eng):
+    """Operator rows of sql on SQLite from EXPLAIN QUERY PLAN (no estimates or timings) and the total time in ms."""
+    with lite_eng.connect() as con:
+        plan = con.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").fetchall()
+        start = time.perf_counter()
+        con.exec_driver_sql(sql).fetchall()
+        total_ms = (time.perf_counter() - start) * 1000
+    depths = {0: -1}
+    rows = []
+    for node_id, parent, _notused, detail in plan:
+        depths[node_id] = depths.get(parent, -1) + 1
+        rows.append(
+            {
+                "depth": depths[node_id],
+                "operator": "  " * depths[node_id] + detail,
+                "estimated_rows": None,
+                "actual_rows": None,
+                "ms": None,
+            }
+        )
+    return rows, total_ms
+
+
+_EXPLAIN = {"duckdb": explain_duckdb, "postgres": explain_postgres, "sqlite": explain_sqlite}
+
+
+def compare_plans(sql, engines):
+    """
+    Plan of sql (canonical DuckDB SQL or a per-engine dict, see benchmark.query_for) on every engine in engines
+    ({engine name: engine}). Returns {engine name: {"sql", "rows", "total_ms"}}, or {"sql", "error"} when the
+    engine could not run it; engines without SQL for the query are left out.
+    """
+    plans = {}
+    for engine_name, engine in engines.items():
+        engine_sql = benchmark.query_for(sql, engine_name, engine)
+        if engine_sql is None:
+            continue
+        try:
+            rows, total_ms = _EXPLAIN[dialects.engine_dialect(engine)](engine_sql, engine)
+        except Exception as e:
+            plans[engine_name] = {"sql": engine_sql, "error": str(e)}
+            continue
+        plans[engine_name] = {
+            "sql": engine_sql,
+            "rows": rows,
+            "total_ms": None if total_ms is None else round(total_ms, 3),
+        }
+    return plans
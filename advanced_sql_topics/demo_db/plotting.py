@@ -0,0 +1,202 @@
+"""
+Plot helpers for the sensor time series.
+
+A line plot cannot show more points than the axes are wide in pixels, but matplotlib still draws every point it is
+given. The downsampling here runs before plotting and keeps the visual shape of the series with a fixed point
+budget for all of them together, shared equally by the series:
+  - "minmax": per pixel-wide bucket the lowest and the highest point (keeps every spike; fully vectorized),
+  - "lttb": Largest-Triangle-Three-Buckets, one point per bucket that best preserves the shape (vectorized over the
+    buckets, see lttb_indices).
+plot_series() draws any number of series (e.g. one per sensor) of one or more columns from one frame, partitioned
+once; beyond LINE_COLLECTION_THRESHOLD (20) series of a column, all its lines go into a single LineCollection
+instead of one Line2D per series.
+"""
+import time
+
+import matplotlib.dates as mdates
+import numpy as np
+import polars as pl
+from matplotlib import colormaps
+from matplotlib.collections import LineCollection
+
+MAX_POINTS = 4000
+LINE_COLLECTION_THRESHOLD = 20
+LTTB_PASSES = 3
+
+
+def minmax_indices(x, y, n_out):
+    """Indices (sorted) of the min and max y of each of n_out // 2 equal-width x buckets. x must be sorted."""
+    n = len(x)
+    if n <= n_out:
+        return np.arange(n)
+    n_buckets = max(n_out // 2, 1)
+    span = x[-1] - x[0]
+    if span == 0:
+        buckets = np.zeros(n, dtype=np.int64)
+    else:
+        buckets = np.minimum(((x - x[0]) / span * n_buckets).astype(np.int64), n_buckets - 1)
+    # x is sorted, so every bucket is a contiguous run of rows.
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    bucket_of = np.repeat(np.arange(len(starts)), np.diff(np.r_[starts, n]))
+    picked = []
+    for reduce in (np.minimum, np.maximum):
+        extremes = reduce.reduceat(y, starts)
+        candidates = np.flatnonzero(y == extremes[bucket_of])
+        _buckets, first = np.unique(bucket_of[candidates], return_index=True)
+        picked.append(candidates[first])
+    return np.unique(np.concatenate(picked))
+
+
+def lttb_indices(x, y, n_out, passes=LTTB_PASSES):
+    """
+    Indices chosen by Largest-Triangle-Three-Buckets, n_out of them including the first and last point.
+    Per bucket the point is picked that spans the largest triangle with the point picked in the bucket before and
+    the average of the bucket after. That makes the buckets depend on each other in turn; here all buckets are
+    picked at once instead, first against the average of the bucket before, then passes - 1 more times against
+    the points picked in the previous pass.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    # n_out - 2 buckets between the first and the last point; n > n_out makes every bucket at least one point wide.
+    starts = np.linspace(1, n - 1, n_out - 1).astype(np.int64)[:-1]
+    sizes = np.diff(np.r_[starts, n - 1])
+    bucket_of = np.repeat(np.arange(n_out - 2), sizes)
+    inner_x, inner_y = x[1:n - 1], y[1:n - 1]
+    offsets = starts - 1
+    mean_x = np.add.reduceat(inner_x, offsets) / sizes
+    mean_y = np.add.reduceat(inner_y, offsets) / sizes
+    next_x, next_y = np.r_[mean_x[1:], x[-1]], np.r_[mean_y[1:], y[-1]]
+    prev_x, prev_y = np.r_[x[0], mean_x[:-1]], np.r_[y[0], mean_y[:-1]]
+    for _ in range(max(passes, 1)):
+        px, py = prev_x[bucket_of], prev_y[bucket_of]
+        # Twice the area of the triangle (previous point, candidate, average of the next bucket).
+        areas = np.abs((px - next_x[bucket_of]) * (inner_y - py) - (px - inner_x) * (next_y[bucket_of] - py))
+        candidates = np.flatnonzero(areas == np.maximum.reduceat(areas, offsets)[bucket_of])
+        _buckets, first = np.unique(bucket_of[candidates], return_index=True)
+        picked = candidates[first]
+        prev_x, prev_y = np.r_[x[0], inner_x[picked[:-1]]], np.r_[y[0], inner_y[picked[:-1]]]
+    return np.r_[0, picked + 1, n - 1]
+
+
+_METHODS = {"minmax": minmax_indices, "lttb": lttb_indices}
+# Fewest points per series a method can reduce a series to.
+_MIN_POINTS = {"minmax": 2, "lttb": 3}
+
+
+def _as_number(series):
+    """Series as float64 numpy values for the bucket arithmetic (timestamps as their epoch nanoseconds)."""
+    if series.dtype == pl.String:
+        series = series.str.to_datetime()
+    if series.dtype.is_temporal():
+        series = series.dt.epoch("ns")
+    return series.cast(pl.Float64).to_numpy()
+
+
+def _downsample_parts(df, x, ys, by, n_points):
+    """
+    {y: [(series key, reduced part)]} for every column y of ys ({y: method}), the series in order of first
+    appearance. df is sorted and partitioned once for all columns; n_points is shared by all series of all columns.
+    Also returns stats as in downsample(), over all columns together.
+    """
+    start = time.perf_counter()
+    df = df.sort(x)
+    parts = df.partition_by(by, maintain_order=True) if by else [df]
+    n_series = max(len(parts) * len(ys), 1)
+    reduced = {}
+    rows_in = 0
+    for y, method in ys.items():
+        select = _METHODS[method]
+        per_series = max(n_points // n_series, _MIN_POINTS[method])
+        reduced[y] = []
+        for part in parts:
+            key = part[by][0] if by and part.height else None
+            part = part.drop_nulls(y)
+            if part.height == 0:
+                continue
+            rows_in += part.height
+            idx = select(_as_number(part[x]), _as_number(part[y]), per_series)
+            reduced[y].append((key, part[idx] if len(idx) < part.height else part))
+    rows_out = sum(part.height for y_parts in reduced.values() for _key, part in y_parts)
+    stats = {
+        "rows_in": rows_in,
+        "rows_out": rows_out,
+        "ratio": rows_in / max(rows_out, 1),
+        "seconds": time.perf_counter() - start,
+    }
+    return reduced, stats
+
+
+def downsample(df, x, y, by=None, n_points=MAX_POINTS, method="minmax"):
+    """
+    df (polars) reduced to at most about n_points rows in total, for plotting y against x.
+    With by, every value of column by is its own series (e.g. by="sensor_id") and gets an equal share of n_points,
+    but at least the 2 (minmax) or 3 (lttb) points a series needs. Rows with a null y are dropped.
+    Returns (reduced df, stats) with stats rows_in, rows_out, ratio (rows_in / rows_out) and seconds.
+    """
+    parts, stats = _downsample_parts(df, x, {y: method}, by, n_points)
+    out = pl.concat([part for _key, part in parts[y]]) if parts[y] else df.clear()
+    return out, stats
+
+
+def _plot_x(series):
+    """x values as matplotlib understands them; text timestamps are parsed first."""
+    if series.dtype == pl.String:
+        series = series.str.to_datetime()
+    return series.to_numpy()
+
+
+def _draw_lines(ax, parts, x, y, label, colors, marker, **line_kwargs):
+    """Draw the series parts ([(key, part)]) of column y as one line each."""
+    for i, (key, part) in enumerate(parts):
+        if colors is not None:
+            line_kwargs["color"] = colors[i % len(colors)]
+        ax.plot(_plot_x(part[x]), part[y].to_numpy(), marker=marker, label=label.format(key=key), **line_kwargs)
+
+
+def _draw_collection(ax, parts, x, y, **line_kwargs):
+    """Draw the series parts ([(key, part)]) of column y as one LineCollection along the viridis colormap."""
+    segments = []
+    for _key, part in parts:
+        xs = _plot_x(part[x])
+        if np.issubdtype(xs.dtype, np.datetime64):
+            xs = mdates.date2num(xs)
+        segments.append(np.column_stack([xs, part[y].to_numpy()]))
+    cmap = colormaps["viridis"]
+    collection = LineCollection(
+        segments, colors=[cmap(i / max(len(segments) - 1, 1)) for i in range(len(segments))], **line_kwargs
+    )
+    ax.add_collection(collection)
+    if parts[0][1].schema[x].is_temporal() or parts[0][1].schema[x] == pl.String:
+        ax.xaxis_date()
+    ax.autoscale_view()
+
+
+def plot_series(
+    ax, df, x, y, by="sensor_id", label="{key}", colors=None, marker="o", n_points=MAX_POINTS,
+    method="minmax", **line_kwargs
+):
+    """
+    Draw y against x on ax for every series in df (one per value of by), downsampled to n_points together.
+    y is a column name, or a dict {column: options} to draw several columns from the frame, which is then still
+    sorted and partitioned only once; options (label, colors, marker, method and line_kwargs) override the
+    arguments below for that column.
+    Up to LINE_COLLECTION_THRESHOLD (20) series of a column each get their own line, with label.format(key=...)
+    in the legend and colors (a list) in turn; more series are drawn as one LineCollection coloured along the
+    viridis colormap, without legend entries.
+    marker is only used when no points were dropped; line_kwargs go to ax.plot / LineCollection.
+    Returns the downsampling stats, over all columns together.
+    """
+    columns = y if isinstance(y, dict) else {y: {}}
+    defaults = {"label": label, "colors": colors, "marker": marker, "method": method, **line_kwargs}
+    options = {col: {**defaults, **col_options} for col, col_options in columns.items()}
+    parts, stats = _downsample_parts(df, x, {col: opts.pop("method") for col, opts in options.items()}, by, n_points)
+    for col, opts in options.items():
+        if stats["ratio"] != 1:
+            opts["marker"] = ""
+        if len(parts[col]) <= LINE_COLLECTION_THRESHOLD:
+            _draw_lines(ax, parts[col], x, col, **opts)
+        else:
+            line_kwargs = {key: value for key, value in opts.items() if key not in ("label", "colors", "marker")}
+            _draw_collection(ax, parts[col], x, col, **line_kwargs)
+    return stats
@@ -0,0 +1,186 @@
+"""
+Memoizing cache for query results.
+
+A result is cached under the engine, the normalized SQL and the data version of every table the query reads.
+The loaders in ingest set a new data version for a table in a database each time they (re)load it there, so a
+reload invalidates the results that depend on it, while re-running a cell on unchanged tables is answered from
+the cache. Versions are kept per database (the engine's URL), not per backend name: the local stand-in for
+Postgres is a SQLite file of its own. Results are always polars DataFrames, from memory, disk or a fresh run.
+Results live in memory, evicted least recently used when they take more than max_bytes, and optionally also
+as Arrow IPC files in a directory, which survive a restart of the notebook.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import marimo as mo
+import polars as pl
+import pyarrow as pa
+import sqlglot
+from sqlglot import exp
+
+from demo_db import csv_cache, dialects, instrument
+
+RESULT_CACHE_MAX_BYTES = 256 * 1024**2
+
+_table_versions = {}
+_versions_lock = threading.Lock()
+
+
+def _engine_key(engine):
+    if dialects.engine_dialect(engine) == "duckdb":
+        return "duckdb"
+    return engine.url.render_as_string(hide_password=True)
+
+
+def set_table_version(engine, table, version):
+    """Record that table in the database of engine (DuckDB connection or SQLAlchemy engine) now holds version."""
+    with _versions_lock:
+        _table_versions[(_engine_key(engine), table.lower())] = str(version)
+
+
+def table_version(engine, table):
+    """Data version of table in the database of engine, or None if the loaders did not load it in this process."""
+    with _versions_lock:
+        return _table_versions.get((_engine_key(engine), table.lower()))
+
+
+def normalize(sql, dialect):
+    """(normalized SQL, names of the tables it reads). Table names are None when sqlglot cannot parse the SQL."""
+    try:
+        expressions = [e for e in sqlglot.parse(sql, read=dialect) if e is not None]
+    except sqlglot.errors.ParseError:
+        return " ".join(sql.split()), None
+    tables = set()
+    for expression in expressions:
+        ctes = {cte.alias_or_name.lower() for cte in expression.find_all(exp.CTE)}
+        tables.update(t.name.lower() for t in expression.find_all(exp.Table) if t.name.lower() not in ctes)
+    return ";".join(e.sql(dialect=dialect) for e in expressions), tables
+
+
+def _as_polars(result):
+    """
+    A mo.sql result as a polars DataFrame. mo.sql returns pandas when polars cannot take the rows as they are
+    (a SQLite column with values of several types); such columns become text.
+    """
+    if result is None or isinstance(result, pl.DataFrame):
+        return result
+    try:
+        return pl.from_pandas(result)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        mixed = {
+            col: result[col].map(lambda value: None if value is None else str(value))
+            for col in result.columns
+            if result[col].dtype == object
+        }
+        return pl.from_pandas(result.assign(**mixed))
+
+
+def _run(query, engine):
+    """mo.sql(query) on engine without output as a polars DataFrame, timed in the query log (see instrument)."""
+    with instrument.measure(engine, query) as measurement:
+        measurement.result = _as_polars(mo.sql(query, engine=engine, output=False))
+    return measurement.result
+
+
+class ResultCache:
+    """
+    Cache around mo.sql. Use `cache.sql(query, engine=...)` where a cell would call mo.sql(query, engine=...).
+    Queries on tables without a known data version are not cached (there is no way to tell if they are stale).
+    """
+
+    def __init__(self, max_bytes=RESULT_CACHE_MAX_BYTES, disk_dir=None, disk_max_bytes=csv_cache.CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "disk_hits": 0, "misses": 0, "uncacheable": 0, "evictions": 0}
+
+    def key(self, query, engine):
+        """Cache key for query on engine, or None if the query cannot be cached."""
+        dialect = dialects.engine_dialect(engine)
+        normalized, tables = normalize(query, dialect)
+        if tables is None:
+            return None
+        versions = []
+        for table in sorted(tables):
+            version = table_version(engine, table)
+            if version is None:
+                return None
+            versions.append(f"{table}@{version}")
+        text = "\n".join([_engine_key(engine), normalized, *versions])
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def sql(self, query, engine):
+        """Result of query on engine (like mo.sql with output=False), from the cache when possible."""
+        key = self.key(query, engine)
+        if key is None:
+            with self._lock:
+                self.counters["uncacheable"] += 1
+            return _run(query, engine)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return self._entries[key][0]
+        result = self._read_disk(key)
+        if result is not None:
+            with self._lock:
+                self.counters["disk_hits"] += 1
+        else:
+            result = _run(query, engine)
+            with self._lock:
+                self.counters["misses"] += 1
+            self._write_disk(key, result)
+        self._put(key, result)
+        return result
+
+    def _put(self, key, result):
+        size = result.estimated_size()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _key, (_result, old_size) = self._entries.popitem(last=False)
+                self._bytes -= old_size
+                self.counters["evictions"] += 1
+
+    def _disk_path(self, key):
+        return f"{self.disk_dir}/{key}.arrow"
+
+    def _read_disk(self, key):
+        if self.disk_dir is None or not os.path.exists(self._disk_path(key)):
+            return None
+        path = self._disk_path(key)
+        os.utime(path)  # Mark as recently used for the eviction.
+        with pa.memory_map(path) as source:
+            return pl.from_arrow(pa.ipc.open_file(source).read_all())
+
+    def _write_disk(self, key, result):
+        if self.disk_dir is None:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        table = result.to_arrow()
+        tmp_path = f"{self._disk_path(key)}.tmp"
+        with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, self._disk_path(key))
+        csv_cache.evict(self.disk_dir, self.disk_max_bytes, keep=self._disk_path(key), pattern="*.arrow")
+
+    def stats(self):
+        """The hit/miss counters with the number of results and bytes held in memory."""
+        with self._lock:
+            return {**self.counters, "entries": len(self._entries), "bytes": self._bytes}
+
+    def clear(self):
+        """Drop all results held in memory (the disk tier is left alone)."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
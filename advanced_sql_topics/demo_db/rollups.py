@@ -0,0 +1,186 @@
+"""
+Per-sensor rollups of the sensor readings per minute, hour and day, in DuckDB.
+
+An aggregate over the raw readings (avg and count per sensor, maybe for some hours only) scans every row each time.
+A rollup table <table>_per_<grain> holds per sensor and time bucket the sum, count, min and max of value, from
+which avg, count, min and max of any set of buckets follow (avg = sum of sums / sum of counts). Each grain is
+built from the next finer one, so the raw readings are read once:
+  - build_rollups() (re)builds them after a load; ingest does this for the tables in ROLLUP_TABLES,
+  - apply_rollups() merges new readings into the existing buckets (INSERT ... ON CONFLICT DO UPDATE), so an append
+    costs in proportion to the appended rows, not to the table.
+aggregate() answers from the coarsest rollup whose buckets fit the filter: a range that starts and ends on whole
+days reads the day rollup, a filter on the hour of the day at least the hour rollup. Filters that cut through
+minutes fall back to the raw table.
+Readings inserted into the table any other way leave the rollups behind until the next build_rollups().
+"""
+import datetime
+
+GRAINS = ("minute", "hour", "day")
+ROLLUP_TABLES = ("sensors", "sensors_big")
+
+_DELTA = "_rollup_delta"
+
+
+def rollup_name(table, grain):
+    """Name of the <grain> rollup table of table."""
+    return f"{table}_per_{grain}"
+
+
+def has_rollups(ddb_eng, table):
+    """True when all rollup tables of table exist in DuckDB."""
+    cur = ddb_eng.cursor()
+    try:
+        names = {row[0] for row in cur.execute("SELECT table_name FROM duckdb_tables()").fetchall()}
+    finally:
+        cur.close()
+    return all(rollup_name(table, grain) in names for grain in GRAINS)
+
+
+def _minute_buckets(source):
+    """Query with the minute buckets of the readings in source (a table name or table expression)."""
+    return f"""
+        SELECT sensor_id, date_trunc('minute', timestamp) AS bucket,
+            coalesce(sum(value), 0) AS sum_value, count(value) AS count_value,
+            min(value) AS min_value, max(value) AS max_value
+        FROM {source}
+        WHERE timestamp IS NOT NULL
+        GROUP BY ALL"""
+
+
+def _coarser_buckets(finer, grain):
+    """Query merging the buckets of the rollup table (or delta) finer into <grain> buckets."""
+    return f"""
+        SELECT sensor_id, date_trunc('{grain}', bucket) AS bucket,
+            sum(sum_value) AS sum_value, sum(count_value) AS count_value,
+            min(min_value) AS min_value, max(max_value) AS max_value
+        FROM {finer}
+        GROUP BY ALL"""
+
+
+def build_rollups(ddb_eng, table="sensors"):
+    """(Re)build the minute, hour and day rollups of table from all its readings. Returns the rows per rollup."""
+    cur = ddb_eng.cursor()
+    try:
+        cur.execute("BEGIN")
+        finer = None
+        for grain in GRAINS:
+            select = _minute_buckets(table) if finer is None else _coarser_buckets(finer, grain)
+            cur.execute(
+                f"""
+                CREATE OR REPLACE TABLE {rollup_name(table, grain)} (
+                    sensor_id BIGINT, bucket TIMESTAMP, sum_value DOUBLE, count_value BIGINT,
+                    min_value DOUBLE, max_value DOUBLE, PRIMARY KEY (sensor_id, bucket)
+                )"""
+            )
+            cur.execute(f"INSERT INTO {rollup_name(table, grain)} {select}")
+            finer = rollup_name(table, grain)
+        cur.execute("COMMIT")
+        return {
+            grain: cur.execute(f"SELECT count(*) FROM {rollup_name(table, grain)}").fetchone()[0] for grain in GRAINS
+        }
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+    finally:
+        cur.close()
+
+
+def apply_rollups(cur, table, source):
+    """
+    Merge the readings in source (a table name or table expression) into the rollups of table, on the DuckDB
+    connection or cursor cur, in its current transaction. The readings are grouped into minute buckets once
+    and every grain is updated from those.
+    """
+    cur.execute(f"CREATE OR REPLACE TEMP TABLE {_DELTA} AS {_minute_buckets(source)}")
+    try:
+        for grain in GRAINS:
+            cur.execute(
+                f"""
+                INSERT INTO {rollup_name(table, grain)} {_coarser_buckets(_DELTA, grain)}
+                ON CONFLICT (sensor_id, bucket) DO UPDATE SET
+                    sum_value = sum_value + EXCLUDED.sum_value,
+                    count_value = count_value + EXCLUDED.count_value,
+                    min_value = least(min_value, EXCLUDED.min_value),
+                    max_value = greatest(max_value, EXCLUDED.max_value)"""
+            )
+    finally:
+        cur.execute(f"DROP TABLE IF EXISTS {_DELTA}")
+
+
+def _on_boundary(bound, grain):
+    """True when the datetime bound is the start of a <grain> bucket."""
+    if bound.second or bound.microsecond:
+        return False
+    return grain == "minute" or (bound.minute == 0 and (grain == "hour" or bound.hour == 0))
+
+
+def choose_grain(start=None, end=None, hours=None):
+    """
+    Coarsest grain whose buckets fit the filter start <= timestamp < end (either may be None) and, with hours,
+    hour of the day in hours. None when no rollup fits and the raw readings have to be read.
+    """
+    for grain in reversed(GRAINS):
+        if hours is not None and grain == "day":
+            continue
+        if all(bound is None or _on_boundary(bound, grain) for bound in (start, end)):
+            return grain
+    return None
+
+
+def _as_datetime(bound):
+    return datetime.datetime.fromisoformat(bound) if isinstance(bound, str) else bound
+
+
+def aggregate_sql(table="sensors", start=None, end=None, hours=None, grain="auto"):
+    """
+    (grain, SQL, parameters) of the aggregate per sensor (avg_value, n_rows, min_value, max_value) of the readings
+    of table with start <= timestamp < end and the hour of the day in hours. grain "auto" picks the coarsest
+    rollup that fits (see choose_grain), None reads the raw readings.
+    """
+    start, end = _as_datetime(start), _as_datetime(end)
+    if grain == "auto":
+        grain = choose_grain(start, end, hours)
+    time_column = "timestamp" if grain is None else "bucket"
+    conditions, params = [], []
+    if start is not None:
+        conditions.append(f"{time_column} >= ?")
+        params.append(start)
+    if end is not None:
+        conditions.append(f"{time_column} < ?")
+        params.append(end)
+    if hours is not None:
+        conditions.append(f"hour({time_column}) IN ({', '.join(str(int(hour)) for hour in hours)})")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    if grain is None:
+        sql = f"""
+            SELECT sensor_id, avg(value) AS avg_value, count(value) AS n_rows,
+                min(value) AS min_value, max(value) AS max_value
+            FROM {table}
+            {where}
+            GROUP BY sensor_id
+            ORDER BY sensor_id"""
+    else:
+        sql = f"""
+            SELECT sensor_id, sum(sum_value) / nullif(sum(count_value), 0) AS avg_value,
+                sum(count_value)::BIGINT AS n_rows, min(min_value) AS min_value, max(max_value) AS max_value
+            FROM {rollup_name(table, grain)}
+            {where}
+            GROUP BY sensor_id
+            ORDER BY sensor_id"""
+    return grain, sql, params
+
+
+def aggregate(ddb_eng, table="sensors", start=None, end=None, hours=None, grain="auto"):
+    """
+    Polars DataFrame with avg_value, n_rows, min_value and max_value per sensor of the readings of table in the
+    filter (see aggregate_sql), and the grain it was answered from (None: the raw readings).
+    Tables without rollups are always aggregated from the raw readings.
+    """
+    if grain is not None and not has_rollups(ddb_eng, table):
+        grain = None
+    grain, sql, params = aggregate_sql(table, start, end, hours, grain)
+    cur = ddb_eng.cursor()
+    try:
+        return cur.execute(sql, params).pl(), grain
+    finally:
+        cur.close()
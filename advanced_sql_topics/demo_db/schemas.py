@@ -0,0 +1,102 @@
+"""
+Declared column types of the demo tables.
+
+Without a schema every step guesses: read_csv_auto sniffs the CSV, pandas infers its dtypes again and to_sql maps
+those to column types, so a column can end up with another type in every database (a boolean column with NULLs
+becomes text through pandas, for instance). SCHEMAS declares per table the column types, in DuckDB's type names,
+and the timestamp format in the CSV. The CSV is then parsed with exactly these types and every database gets
+the table created up front, with the native type of each column:
+  - TIMESTAMP: TIMESTAMP in DuckDB and Postgres; SQLite has no date type and stores ISO text in a TIMESTAMP column,
+  - BOOLEAN: BOOLEAN; SQLite stores 0/1,
+  - DOUBLE: DOUBLE / DOUBLE PRECISION / REAL.
+Tables without an entry keep the inferred types.
+"""
+import polars as pl
+import pyarrow as pa
+import sqlalchemy as sa
+
+TIMESTAMP_FORMAT = "%Y/%m/%dT%H:%M:%S"
+
+SCHEMAS = {
+    "sensors": {
+        "columns": {"sensor_id": "BIGINT", "timestamp": "TIMESTAMP", "value": "DOUBLE", "n": "DOUBLE"},
+        "timestamp_format": TIMESTAMP_FORMAT,
+    },
+    "employee": {"columns": {"emp_id": "BIGINT", "emp_name": "VARCHAR", "boss_id": "BIGINT"}},
+    "t1": {"columns": {"a": "BIGINT", "b": "VARCHAR", "c": "BOOLEAN", "d": "BIGINT", "t2_aa": "BIGINT"}},
+    "t2": {"columns": {"aa": "BIGINT", "bb": "VARCHAR"}},
+}
+
+_ARROW_TYPES = {
+    "BIGINT": pa.int64(), "DOUBLE": pa.float64(), "BOOLEAN": pa.bool_(), "TIMESTAMP": pa.timestamp("us"),
+    "VARCHAR": pa.string(),
+}
+_SA_TYPES = {
+    "BIGINT": sa.BigInteger, "DOUBLE": sa.Double, "BOOLEAN": sa.Boolean, "TIMESTAMP": sa.TIMESTAMP, "VARCHAR": sa.Text,
+}
+_POLARS_TYPES = {
+    "BIGINT": pl.Int64, "DOUBLE": pl.Float64, "BOOLEAN": pl.Boolean, "TIMESTAMP": pl.Datetime("us"),
+    "VARCHAR": pl.String,
+}
+
+
+def csv_reader(name, csv_path):
+    """
+    DuckDB table expression that parses csv_path (a tab separated file) with the declared types of table <name>,
+    or read_csv_auto when it has no schema.
+    """
+    schema = SCHEMAS.get(name)
+    if schema is None:
+        return f"read_csv_auto('{csv_path}')"
+    columns = ", ".join(f"'{col}': '{col_type}'" for col, col_type in schema["columns"].items())
+    timestamp_format = schema.get("timestamp_format")
+    options = f", timestampformat='{timestamp_format}'" if timestamp_format else ""
+    return f"read_csv('{csv_path}', delim='\\t', header=true, columns={{{columns}}}{options})"
+
+
+def arrow_schema(name):
+    """pyarrow schema of table <name>, or None when it has no schema."""
+    schema = SCHEMAS.get(name)
+    if schema is None:
+        return None
+    return pa.schema([(col, _ARROW_TYPES[col_type]) for col, col_type in schema["columns"].items()])
+
+
+def duckdb_ddl(name):
+    """CREATE TABLE statement for table <name> in DuckDB, or None when it has no schema."""
+    schema = SCHEMAS.get(name)
+    if schema is None:
+        return None
+    columns = ", ".join(f'"{col}" {col_type}' for col, col_type in schema["columns"].items())
+    return f'CREATE TABLE "{name}" ({columns})'
+
+
+def create_table(name, engine):
+    """
+    Create the empty table <name> with its declared column types through the SQLAlchemy engine.
+    Returns False (and creates nothing) when the table has no schema.
+    """
+    schema = SCHEMAS.get(name)
+    if schema is None:
+        return False
+    metadata = sa.MetaData()
+    sa.Table(name, metadata, *(sa.Column(col, _SA_TYPES[col_type]()) for col, col_type in schema["columns"].items()))
+    metadata.create_all(engine)
+    return True
+
+
+def typed_frame(df, name):
+    """
+    Polars df (a result with columns of table <name>) with the declared types, e.g. for SQLite results where
+    booleans come back as 0/1 and timestamps as text. Columns without a declared type are left as they are.
+    """
+    columns = SCHEMAS.get(name, {}).get("columns", {})
+    casts = []
+    for col in df.columns:
+        if col not in columns or df.schema[col] == _POLARS_TYPES[columns[col]]:
+            continue
+        if columns[col] == "TIMESTAMP" and df.schema[col] == pl.String:
+            casts.append(pl.col(col).str.to_datetime(time_unit="us"))
+        else:
+            casts.append(pl.col(col).cast(_POLARS_TYPES[columns[col]]))
+    return df.with_columns(casts) if casts else df
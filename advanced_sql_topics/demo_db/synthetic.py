@@ -0,0 +1,173 @@
+"""
+Seeded generators for large versions of the demo tables.
+
+The CSV files in tables/ have a few hundred rows at most, far too few to see how the loaders and queries behave
+on real data volumes. Every generator here returns a pyarrow RecordBatchReader with the columns and types of its
+table in schemas.SCHEMAS and produces the rows batch by batch, so the size of a table is only limited by disk space:
+  - sensors: n_sensors sensors × one reading every freq_seconds × duration_hours, a noisy sine per sensor,
+  - employee: a management tree with fan_out reports per boss and depth levels,
+  - t1 / t2: t1.t2_aa matches a t2 row for a fraction selectivity of the rows and is NULL for null_rate of them.
+The same parameters (seed and batch_rows included) always give the same data, so a table can be generated once
+per database instead of being kept in memory (see load_generated).
+"""
+import datetime
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from demo_db import ingest, schemas
+
+BATCH_ROWS = 100_000
+_NAMES = np.array(["John", "Jill", "Alan", "Caroline", "Bob", "Mei", "Emilia", "Milo", "Landon", "Adeline", "Zach"])
+
+
+def _reader(schema, make_batch, n_rows, batch_rows, seed):
+    """RecordBatchReader over make_batch(rng, start, stop) for consecutive row ranges of at most batch_rows rows."""
+
+    def batches():
+        rng = np.random.default_rng(seed)
+        for start in range(0, n_rows, batch_rows):
+            yield pa.RecordBatch.from_pydict(make_batch(rng, start, min(start + batch_rows, n_rows)), schema=schema)
+
+    return pa.RecordBatchReader.from_batches(schema, batches())
+
+
+def sensors(
+    n_sensors=2, freq_seconds=60, duration_hours=24, start=datetime.datetime(2025, 5, 20, 10), noise=0.15, seed=0,
+    batch_rows=BATCH_ROWS,
+):
+    """
+    Readings of n_sensors sensors, every freq_seconds for duration_hours from start, ordered by sensor and time.
+    value is sin(n) plus normal noise with standard deviation noise, n goes up by 0.1 per reading of a sensor
+    and every sensor has its own phase.
+    """
+    schema = schemas.arrow_schema("sensors")
+    steps = int(duration_hours * 3600 // freq_seconds)
+    start_us = int(start.replace(tzinfo=datetime.timezone.utc).timestamp()) * 1_000_000
+    phases = np.random.default_rng(seed).uniform(0, 2 * np.pi, n_sensors)
+    phases[0] = 0.0
+
+    def make_batch(rng, first, stop):
+        rows = np.arange(first, stop)
+        sensor, step = np.divmod(rows, steps)
+        n = step * 0.1
+        return {
+            "sensor_id": sensor + 1,
+            "timestamp": start_us + step * (freq_seconds * 1_000_000),
+            "value": np.sin(n + phases[sensor]) + rng.normal(0, noise, len(rows)),
+            "n": n,
+        }
+
+    return _reader(schema, make_batch, n_sensors * steps, batch_rows, seed)
+
+
+def employee(fan_out=3, depth=5, seed=0, batch_rows=BATCH_ROWS):
+    """
+    A management tree: emp_id 1 has no boss, every other employee reports to the one fan_out levels up in
+    breadth-first order, so there are 1 + fan_out + ... + fan_out**(depth - 1) employees on depth levels.
+    """
+    schema = schemas.arrow_schema("employee")
+    n_rows = sum(fan_out**level for level in range(depth))
+
+    def make_batch(rng, first, stop):
+        emp_id = np.arange(first + 1, stop + 1)
+        boss_id = (emp_id - 2) // fan_out + 1
+        return {
+            "emp_id": emp_id,
+            "emp_name": rng.choice(_NAMES, len(emp_id)),
+            "boss_id": pa.array(boss_id, mask=emp_id == 1),
+        }
+
+    return _reader(schema, make_batch, n_rows, batch_rows, seed)
+
+
+def t1(rows=1_000_000, t2_rows=1000, selectivity=0.5, null_rate=0.1, seed=0, batch_rows=BATCH_ROWS):
+    """
+    t1 with rows rows. A fraction selectivity of them has a t2_aa that joins to t2 (generated with t2_rows
+    rows), a fraction null_rate has t2_aa NULL and the rest points past the end of t2. c is NULL at null_rate too.
+    """
+    if selectivity < 0 or null_rate < 0 or selectivity + null_rate > 1:
+        raise ValueError("selectivity and null_rate must be fractions that add up to at most 1.")
+    schema = schemas.arrow_schema("t1")
+
+    def make_batch(rng, first, stop):
+        a = np.arange(first + 1, stop + 1)
+        draw = rng.random(len(a))
+        matches = draw < selectivity
+        t2_aa = np.where(matches, rng.integers(1, t2_rows + 1, len(a)), t2_rows + a)
+        return {
+            "a": a,
+            "b": rng.choice(np.array(["A", "B", "C"]), len(a)),
+            "c": pa.array(rng.random(len(a)) < 0.5, mask=rng.random(len(a)) < null_rate),
+            "d": a * 10,
+            "t2_aa": pa.array(t2_aa, mask=draw >= 1 - null_rate),
+        }
+
+    return _reader(schema, make_batch, rows, batch_rows, seed)
+
+
+def t2(rows=1000, seed=0, batch_rows=BATCH_ROWS):
+    """t2 with aa = 1 .. rows."""
+    schema = schemas.arrow_schema("t2")
+
+    def make_batch(rng, first, stop):
+        aa = np.arange(first + 1, stop + 1)
+        return {"aa": aa, "bb": np.char.add("Value ", aa.astype(str))}
+
+    return _reader(schema, make_batch, rows, batch_rows, seed)
+
+
+GENERATORS = {"sensors": sensors, "employee": employee, "t1": t1, "t2": t2}
+
+
+def _csv_batch(batch):
+    """batch with its timestamps formatted the way they are in tables/*.csv."""
+    columns = [
+        pc.strftime(column.cast(pa.timestamp("s")), schemas.TIMESTAMP_FORMAT)
+        if pa.types.is_timestamp(column.type) else column
+        for column in batch.columns
+    ]
+    return pa.RecordBatch.from_arrays(columns, names=batch.schema.names)
+
+
+def write_csv(reader, path):
+    """Write the batches of reader to a tab separated file like those in tables/. Returns the number of rows."""
+    n_rows = 0
+    schema = pa.schema([
+        pa.field(field.name, pa.string()) if pa.types.is_timestamp(field.type) else field for field in reader.schema
+    ])
+    options = pa_csv.WriteOptions(include_header=False, delimiter="\t", quoting_style="none")
+    with pa.OSFile(path, "wb") as sink:
+        # Written by hand, as CSVWriter always quotes the column names.
+        sink.write(("\t".join(reader.schema.names) + "\n").encode("utf-8"))
+        with pa_csv.CSVWriter(sink, schema, write_options=options) as writer:
+            for batch in reader:
+                writer.write_batch(_csv_batch(batch))
+                n_rows += batch.num_rows
+    return n_rows
+
+
+def write_parquet(reader, path):
+    """Write the batches of reader to a Parquet file, one row group per batch. Returns the number of rows."""
+    n_rows = 0
+    with pq.ParquetWriter(path, reader.schema) as writer:
+        for batch in reader:
+            writer.write_batch(batch)
+            n_rows += batch.num_rows
+    return n_rows
+
+
+def load_generated(kind, ddb_eng, pg_eng, lite_eng, name=None, backends=None, **params):
+    """
+    Generate a <kind> table (a key of GENERATORS, with params for its generator) into all three databases as
+    table <name> (default: kind), batch by batch. Every database reads its own copy of the same generated data,
+    so at most a few batches are in memory at any time. Returns the timings of ingest.load_backends.
+    """
+    generate = GENERATORS[kind]
+    return ingest.load_backends(
+        name or kind, lambda: generate(**params), ddb_eng, pg_eng, lite_eng, prefix=f"{name or kind}: ",
+        backends=backends,
+    )
@@ -0,0 +1,162 @@
+"""
+Check that DuckDB, Postgres and SQLite return the same result for the same query.
+
+"The same" needs some care, as the engines differ in more than the SQL:
+  - row order is undefined without ORDER BY, so results are compared as multisets of rows,
+  - types differ: SQLite returns booleans as 0/1 and timestamps as text, Postgres ROUND gives a NUMERIC, column
+    names come back lower case from Postgres. normalize() brings the results to common types per column:
+    numbers (booleans included) become Int64, or Float64 rounded to `decimals` places when any engine returns
+    fractions; text timestamps are parsed when another engine returns a timestamp; everything else becomes String.
+The comparison is vectorized: every row gets a 64-bit hash of its normalized values (polars hash_rows). When the
+sorted hashes of two results are equal, so are the results; otherwise the hash counts are joined and the rows
+whose count differs are reported, on the side that has them more often. Per column, the (wrapping) sum of the value hashes gives an order-insensitive fingerprint, so the columns
+whose values differ are named without looking at rows. Two different rows with the same hash would go unnoticed;
+with 64-bit hashes that is negligible at the sizes of a notebook.
+"""
+import polars as pl
+
+from demo_db import benchmark, dialects, paging
+
+DECIMALS = 9
+FETCH_ROWS = 100_000
+HASH_SEED = 0
+
+
+def fetch(sql, engine):
+    """Complete result of sql on engine as a polars DataFrame (DuckDB through Arrow, the others page by page)."""
+    if dialects.engine_dialect(engine) == "duckdb":
+        cur = engine.cursor()
+        try:
+            return cur.execute(sql).pl()
+        finally:
+            cur.close()
+    return pl.concat(list(paging.stream_pages(sql, engine, FETCH_ROWS)), how="vertical_relaxed")
+
+
+def _target_type(dtypes):
+    """Common type of one column, given its dtypes in the results of the engines."""
+    dtypes = [dtype for dtype in dtypes if dtype != pl.Null]
+    if any(dtype.is_temporal() for dtype in dtypes):
+        return pl.Datetime("us")
+    if dtypes and all(dtype.is_numeric() or dtype == pl.Boolean for dtype in dtypes):
+        if any(dtype.is_float() or dtype.is_decimal() for dtype in dtypes):
+            return pl.Float64
+        return pl.Int64
+    return pl.String
+
+
+def _to_type(col, dtype, target, decimals):
+    """Expression casting column col (of dtype) to target."""
+    expr = pl.col(col)
+    if target == pl.Datetime("us"):
+        if dtype == pl.String:
+            return expr.str.to_datetime(time_unit="us", strict=False)
+        if isinstance(dtype, pl.Datetime) and dtype.time_zone is not None:
+            expr = expr.dt.convert_time_zone("UTC").dt.replace_time_zone(None)
+        return expr.cast(target)
+    if target == pl.Float64:
+        # Adding 0.0 turns -0.0 into 0.0, which hashes differently.
+        return expr.cast(pl.Float64, strict=False).round(decimals) + 0.0
+    return expr.cast(target, strict=False)
+
+
+def normalize(results, decimals=DECIMALS):
+    """
+    {engine name: DataFrame} with the results brought to common column names (lower case; those of the first
+    result when the names differ but the number of columns is the same) and types, see the module doc.
+    Raises ValueError when the results have different numbers of columns.
+    """
+    frames = {name: df.rename(str.lower) for name, df in results.items()}
+    reference = next(iter(frames.values())).columns
+    for name, df in frames.items():
+        if len(df.columns) != len(reference):
+            raise ValueError(f"{name} returns {len(df.columns)} columns, expected {len(reference)}: {df.columns}")
+        if df.columns != reference:
+            frames[name] = df.rename(dict(zip(df.columns, reference)))
+    targets = {col: _target_type([df.schema[col] for df in frames.values()]) for col in reference}
+    return {
+        name: df.select(_to_type(col, df.schema[col], targets[col], decimals).alias(col) for col in reference)
+        for name, df in frames.items()
+    }
+
+
+def _fingerprints(df):
+    """Order-insensitive fingerprint per column: the wrapping sum of the hashes of its values."""
+    return df.select(pl.all().hash(HASH_SEED).sum()).row(0, named=True)
+
+
+def compare(left, right, max_rows=20):
+    """
+    Compare two normalized results as multisets of rows. Returns a dict with
+      equal: True when both hold the same rows the same number of times,
+      rows: (rows of left, rows of right),
+      columns: names of the columns whose values differ,
+      only_left / only_right: up to max_rows distinct rows that left / right has more often than the other side,
+        with the surplus count in column "surplus",
+      mismatched_rows: the number of surplus rows on both sides together.
+    """
+    left_hashed = left.with_columns(_hash=left.hash_rows(HASH_SEED))
+    right_hashed = right.with_columns(_hash=right.hash_rows(HASH_SEED))
+    if left.height == right.height and left_hashed["_hash"].sort().equals(right_hashed["_hash"].sort()):
+        empty = left.head(0).with_columns(surplus=pl.lit(0, pl.Int64))
+        return {
+            "equal": True, "rows": (left.height, right.height), "columns": [], "only_left": empty,
+            "only_right": empty, "mismatched_rows": 0,
+        }
+    counts = (
+        left_hashed.group_by("_hash").len("_left")
+        .join(right_hashed.group_by("_hash").len("_right"), on="_hash", how="full", coalesce=True)
+        .fill_null(0)
+        .with_columns(surplus=pl.col("_left").cast(pl.Int64) - pl.col("_right").cast(pl.Int64))
+        .filter(pl.col("surplus") != 0)
+    )
+
+    def surplus_rows(hashed, sign):
+        differing = counts.filter(pl.col("surplus") * sign > 0).select("_hash", surplus=pl.col("surplus") * sign)
+        return (
+            hashed.filter(pl.col("_hash").is_in(differing["_hash"].implode()))
+            .unique("_hash", maintain_order=True)
+            .head(max_rows)
+            .join(differing, on="_hash", how="left")
+            .drop("_hash")
+        )
+
+    left_prints, right_prints = _fingerprints(left), _fingerprints(right)
+    return {
+        "equal": counts.height == 0,
+        "rows": (left.height, right.height),
+        "columns": [col for col in left.columns if left_prints[col] != right_prints[col]],
+        "only_left": surplus_rows(left_hashed, 1),
+        "only_right": surplus_rows(right_hashed, -1),
+        "mismatched_rows": int(counts["surplus"].abs().sum()),
+    }
+
+
+def verify(sql, engines, decimals=DECIMALS, max_rows=20):
+    """
+    Run sql (canonical DuckDB SQL or a per-engine dict, see benchmark.query_for) on every engine in engines
+    ({engine name: engine}) and compare each result with that of the first engine. Returns {engine name: report}
+    with the dict of compare() for the other engines, {"error"} for an engine that could not run the query and
+    {"rows"} for the reference engine.
+    """
+    results, reports = {}, {}
+    for engine_name, engine in engines.items():
+        engine_sql = benchmark.query_for(sql, engine_name, engine)
+        if engine_sql is None:
+            continue
+        try:
+            results[engine_name] = fetch(engine_sql, engine)
+        except Exception as e:
+            reports[engine_name] = {"error": str(e)}
+    if not results:
+        return reports
+    try:
+        normalized = normalize(results, decimals)
+    except ValueError as e:
+        return {**reports, **{engine_name: {"error": str(e)} for engine_name in results}}
+    reference_name, reference = next(iter(normalized.items()))
+    reports[reference_name] = {"rows": reference.height}
+    for engine_name, df in normalized.items():
+        if engine_name != reference_name:
+            reports[engine_name] = compare(reference, df, max_rows)
+    return reports
@@ -0,0 +1,215 @@
+"""
+Sliding-window statistics of the sensor readings, maintained as readings arrive.
+
+The notebook computes per sensor, ordered by timestamp,
+    mv_avg_val:       avg(value) OVER (... ROWS BETWEEN 3 PRECEDING AND 3 FOLLOWING)
+    value_difference: ROUND(value - LAG(value, 1, value) OVER (...), 3)
+over the whole table on every run. SensorWindows keeps both per sensor and updates them on append(): a new
+reading changes the moving average of at most `preceding` rows before and `following` rows after it and the
+difference of itself and the next row, so only those rows are recomputed. Readings at the end of a sensor's
+series (the normal case) are written into preallocated arrays; late readings are inserted in timestamp order.
+NULL values count as in SQL: avg skips them and a difference with a NULL is NULL.
+append_sensors() also inserts the readings into the sensors table of the databases; WINDOW_SQL is the query
+whose result frame() reproduces.
+"""
+import time
+
+import numpy as np
+import polars as pl
+import sqlalchemy as sa
+
+from demo_db import result_cache, rollups
+
+
+class _Series:
+    """Timestamps, values and window results of one sensor, in timestamp order, in arrays with spare capacity."""
+
+    def __init__(self):
+        self.size = 0
+        self.timestamp = np.empty(0, dtype="datetime64[us]")
+        self.value = np.empty(0)
+        self.mv_avg = np.empty(0)
+        self.diff = np.empty(0)
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self.value), 64)
+        for name in ("timestamp", "value", "mv_avg", "diff"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def insert(self, timestamps, values):
+        """Add readings (sorted by timestamp). Returns the positions they got, in the updated series."""
+        n_new = len(values)
+        if self.size + n_new > len(self.value):
+            self._grow(self.size + n_new)
+        if self.size == 0 or timestamps[0] >= self.timestamp[self.size - 1]:
+            positions = np.arange(self.size, self.size + n_new)
+            self.timestamp[positions] = timestamps
+            self.value[positions] = values
+        else:
+            # A late reading: shift the later rows up. Equal timestamps keep the earlier reading first.
+            at = np.searchsorted(self.timestamp[:self.size], timestamps, side="right")
+            positions = at + np.arange(n_new)
+            old = np.ones(self.size + n_new, dtype=bool)
+            old[positions] = False
+            for name, new_values in (("timestamp", timestamps), ("value", values), ("mv_avg", None), ("diff", None)):
+                array = getattr(self, name)
+                merged = np.empty(self.size + n_new, dtype=array.dtype)
+                merged[old] = array[:self.size]
+                if new_values is not None:
+                    merged[positions] = new_values
+                array[:self.size + n_new] = merged
+        self.size += n_new
+        return positions
+
+
+def _round_half_away(x, decimals):
+    """Round like SQL ROUND on a double (half away from zero), not numpy's half to even."""
+    factor = 10.0**decimals
+    return np.trunc(x * factor + np.copysign(0.5, x)) / factor
+
+
+class SensorWindows:
+    """
+    Moving average and LAG difference per sensor, kept up to date by append(). frame() gives the same rows as
+    WINDOW_SQL, the SQL of the sens_df2 / sens_df3 cells (for all sensors).
+    """
+
+    def __init__(self, preceding=3, following=3, decimals=3):
+        self.preceding = preceding
+        self.following = following
+        self.decimals = decimals
+        self._series = {}
+        self.counters = {"appends": 0, "rows": 0, "recomputed": 0}
+
+    @classmethod
+    def from_table(cls, ddb_eng, table="sensors", batch_rows=65_536, **kwargs):
+        """SensorWindows over all readings in the DuckDB table, read in batches ordered by sensor and timestamp."""
+        windows = cls(**kwargs)
+        cur = ddb_eng.cursor()
+        try:
+            reader = cur.execute(
+                f"SELECT sensor_id, timestamp, value FROM {table} ORDER BY sensor_id, timestamp"
+            ).fetch_record_batch(batch_rows)
+            for batch in reader:
+                windows.append(pl.from_arrow(batch))
+        finally:
+            cur.close()
+        return windows
+
+    def append(self, readings):
+        """
+        Add readings (a polars or pandas DataFrame with sensor_id, timestamp and value) and update the window
+        results of the rows they affect. Returns the number of rows that were recomputed.
+        """
+        if not isinstance(readings, pl.DataFrame):
+            readings = pl.from_pandas(readings) if hasattr(readings, "to_numpy") else pl.DataFrame(readings)
+        readings = readings.select(
+            "sensor_id", pl.col("timestamp").cast(pl.Datetime("us")), pl.col("value").cast(pl.Float64)
+        ).sort("sensor_id", "timestamp", maintain_order=True)
+        recomputed = 0
+        for part in readings.partition_by("sensor_id", maintain_order=True):
+            series = self._series.setdefault(part["sensor_id"][0], _Series())
+            positions = series.insert(part["timestamp"].to_numpy(), part["value"].to_numpy())
+            recomputed += self._update(series, positions)
+        self.counters["rows"] += readings.height
+        self.counters["appends"] += 1
+        self.counters["recomputed"] += recomputed
+        return recomputed
+
+    def _update(self, series, positions):
+        """Recompute the moving average and difference of the rows around the new positions."""
+        n = series.size
+        values = series.value[:n]
+        offsets = np.arange(-self.preceding, self.following + 1)
+        touched = np.zeros(n, dtype=bool)
+        touched[np.clip((positions[:, None] + offsets).ravel(), 0, n - 1)] = True
+        rows = np.flatnonzero(touched)
+        window = rows[:, None] + offsets
+        in_frame = (window >= 0) & (window < n)
+        window_values = np.where(in_frame, values[np.clip(window, 0, n - 1)], np.nan)
+        present = ~np.isnan(window_values)
+        total = np.zeros(len(rows))
+        for k in range(window_values.shape[1]):  # Left to right, like the SQL aggregate adds them.
+            total += np.where(present[:, k], window_values[:, k], 0.0)
+        count = present.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            series.mv_avg[rows] = np.where(count > 0, total / count, np.nan)
+
+        diff_rows = np.unique(np.clip(np.concatenate([positions, positions + 1]), 0, n - 1))
+        previous = np.where(diff_rows > 0, values[np.maximum(diff_rows - 1, 0)], values[diff_rows])
+        series.diff[diff_rows] = _round_half_away(values[diff_rows] - previous, self.decimals)
+        return len(rows)
+
+    def frame(self, sensor_ids=None):
+        """
+        Polars DataFrame sensor_id, timestamp, value, mv_avg_val, value_difference, ordered by sensor and time,
+        for all sensors or those in sensor_ids.
+        """
+        parts = []
+        for sensor_id in sorted(self._series if sensor_ids is None else sensor_ids):
+            series = self._series[sensor_id]
+            n = series.size
+            parts.append(
+                pl.DataFrame(
+                    {
+                        "sensor_id": np.full(n, sensor_id),
+                        "timestamp": series.timestamp[:n],
+                        "value": series.value[:n],
+                        "mv_avg_val": series.mv_avg[:n],
+                        "value_difference": series.diff[:n],
+                    }
+                ).with_columns(pl.col("value", "mv_avg_val", "value_difference").fill_nan(None))
+            )
+        if not parts:
+            return pl.DataFrame(
+                schema={"sensor_id": pl.Int64, "timestamp": pl.Datetime("us"), "value": pl.Float64,
+                        "mv_avg_val": pl.Float64, "value_difference": pl.Float64}
+            )
+        return pl.concat(parts)
+
+
+WINDOW_SQL = """
+    SELECT s.sensor_id, s.timestamp, s.value,
+        avg(s.value) OVER (
+            PARTITION BY s.sensor_id ORDER BY s.timestamp ROWS BETWEEN 3 PRECEDING AND 3 FOLLOWING
+        ) AS mv_avg_val,
+        ROUND(s.value - LAG(s.value, 1, s.value) OVER (PARTITION BY s.sensor_id ORDER BY s.timestamp), 3)
+        AS value_difference
+    FROM {table} AS s
+    ORDER BY s.sensor_id, s.timestamp"""
+
+
+def append_sensors(readings, windows, ddb_eng=None, pg_eng=None, lite_eng=None, table="sensors"):
+    """
+    Insert readings (polars DataFrame with the columns of the sensors table, or a subset) into table in the
+    given databases and into windows. In DuckDB the rollups of the table (see rollups) are updated in the same
+    transaction. The table gets a new data version in result_cache, so cached queries on it rerun.
+    Returns the number of rows windows recomputed.
+    """
+    version = time.time_ns()
+    if ddb_eng is not None:
+        cur = ddb_eng.cursor()
+        try:
+            cur.register("_new_readings", readings.to_arrow())
+            cur.execute("BEGIN")
+            cur.execute(f"INSERT INTO {table} BY NAME SELECT * FROM _new_readings")
+            if rollups.has_rollups(ddb_eng, table):
+                rollups.apply_rollups(cur, table, "_new_readings")
+            cur.execute("COMMIT")
+            cur.unregister("_new_readings")
+        finally:
+            cur.close()
+        result_cache.set_table_version(ddb_eng, table, version)
+    column_list = ", ".join(f'"{col}"' for col in readings.columns)
+    params = ", ".join(f":{col}" for col in readings.columns)
+    insert = sa.text(f'INSERT INTO "{table}" ({column_list}) VALUES ({params})')
+    for engine in (pg_eng, lite_eng):
+        if engine is None:
+            continue
+        with engine.begin() as con:
+            con.execute(insert, readings.to_dicts())
+        result_cache.set_table_version(engine, table, version)
+    return windows.append(readings)